@@ -1,16 +1,146 @@
-from flask import Flask, request, jsonify
+import json
+import os
+
+from flask import Flask, Response, abort, request, jsonify, stream_with_context
 from inference_facebook_model import Infere
+from inference_base_nlp import Infere as IntentInfere
+from inference_momo_assistant import Infere as AssistantInfere
+from utils.batching import MicroBatcher
+
+# Requests arriving within MAX_BATCH_WAIT_MS of each other share one forward pass
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 16))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", 5))
+# Upper bound on the number of queries accepted by one /predict/batch call
+MAX_QUERIES_PER_CALL = int(os.getenv("MAX_QUERIES_PER_CALL", 256))
 
 app = Flask(__name__)
 
+generation_batcher = MicroBatcher(
+    lambda queries: Infere().predict_batch(queries),
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_BATCH_WAIT_MS,
+    name="opt-125m-batcher",
+)
+intent_batcher = MicroBatcher(
+    IntentInfere.predict_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_BATCH_WAIT_MS,
+    name="tinybert-batcher",
+)
+
 @app.route('/predict', methods=['POST'])
 def predict():
     data = request.json
     user_query = data['query']
-    mapped_result = Infere().predict(user_query)
+    if data.get('model') == 'tinybert':
+        _, mapped_result = intent_batcher(user_query)
+    else:
+        mapped_result = generation_batcher(user_query)
     return jsonify(mapped_result)
 
+def format_sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def iter_sse_events(query):
+    # Server-sent events: one "token" event per decoded token, then a "done" event with the parsed answer
+    for event, data in Infere().stream(query):
+        yield format_sse_event(event, data)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    data = request.json
+    user_query = data['query']
+    return Response(
+        stream_with_context(iter_sse_events(user_query)), mimetype='text/event-stream', headers=SSE_HEADERS
+    )
+
+def parse_batch_queries(body, ndjson=False):
+    """Return the list of queries from a batch request body.
+
+    The body is either a JSON object `{"queries": [...]}` or, when `ndjson`
+    is set, one `{"query": ...}` object per line. Raises ValueError on
+    malformed input.
+    """
+    if ndjson:
+        queries = [json.loads(line)['query'] for line in body.splitlines() if line.strip()]
+    else:
+        queries = json.loads(body or 'null')
+        queries = queries.get('queries') if isinstance(queries, dict) else None
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        raise ValueError("Expected a list of query strings")
+    if len(queries) > MAX_QUERIES_PER_CALL:
+        raise ValueError(f"At most {MAX_QUERIES_PER_CALL} queries per call")
+    return queries
+
+def format_batch_results(queries, results):
+    return [{"query": query, **mapped_result} for query, (_, mapped_result) in zip(queries, results)]
+
+def iter_ndjson_results(queries, chunk_size=MAX_BATCH_SIZE):
+    # Each chunk is one forward pass; its lines are sent as soon as it is classified
+    for start in range(0, len(queries), chunk_size):
+        chunk = queries[start:start + chunk_size]
+        for item in format_batch_results(chunk, IntentInfere.predict_batch(chunk)):
+            yield json.dumps(item) + "\n"
+
+def read_batch_request():
+    try:
+        return parse_batch_queries(
+            request.get_data(as_text=True), ndjson=request.mimetype == 'application/x-ndjson'
+        )
+    except (ValueError, KeyError, TypeError) as error:
+        abort(400, description=str(error))
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    queries = read_batch_request()
+    if not queries:
+        return jsonify([])
+    return jsonify(format_batch_results(queries, IntentInfere.predict_batch(queries)))
+
+@app.route('/predict/batch/stream', methods=['POST'])
+def predict_batch_stream():
+    queries = read_batch_request()
+    return Response(stream_with_context(iter_ndjson_results(queries)), mimetype='application/x-ndjson')
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    # MoMo assistant; with MOMO_SEMANTIC_CACHE=1 standalone questions are answered from the semantic cache when possible
+    data = request.json
+    return jsonify(AssistantInfere.answer(data['question'], data.get('history')))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        "opt-125m": generation_batcher.stats(),
+        "opt-125m_generation": Infere.generation_stats(),
+        "tinybert": intent_batcher.stats(),
+        "tinybert_cache": IntentInfere.cache_stats(),
+        "tinybert_token_cache": IntentInfere.token_cache_stats(),
+        "tinybert_rules": IntentInfere.rule_stats(),
+        "momo_assistant": AssistantInfere.generation_stats(),
+        "momo_assistant_cache": AssistantInfere.cache_stats(),
+    })
+
+@app.route('/reload', methods=['POST'])
+def reload():
+    # Swap in a newly fine-tuned model without restarting the server
+    Infere.reload()
+    IntentInfere.reload()
+    AssistantInfere.reload()
+    return jsonify({"status": "reloaded"})
+
 if __name__ == '__main__':
+    # Load the models before accepting traffic so the first request is not slowed down
+    Infere.warm_up()
+    IntentInfere.warm_up()
+    AssistantInfere.warm_up()
     app.run(host='0.0.0.0', port=5000, debug=True)
 
-    # curl -X POST http://127.0.0.1:5000/predict -H "Content-Type: application/json" -d '{"query": "Send $50 to John"}'
\ No newline at end of file
+    # curl -X POST http://127.0.0.1:5000/predict -H "Content-Type: application/json" -d '{"query": "Send $50 to John"}'
+    # curl -X POST http://127.0.0.1:5000/predict -H "Content-Type: application/json" -d '{"query": "Check my balance", "model": "tinybert"}'
+    # curl -N -X POST http://127.0.0.1:5000/predict/stream -H "Content-Type: application/json" -d '{"query": "Send 50 ZAR to John"}'
+    # curl -X POST http://127.0.0.1:5000/chat -H "Content-Type: application/json" -d '{"question": "How does MoKash work?"}'
+    # curl -X POST http://127.0.0.1:5000/predict/batch -H "Content-Type: application/json" -d '{"queries": ["Check my balance", "Pay 300 ZAR for water"]}'
+    # curl -X POST http://127.0.0.1:5000/predict/batch/stream -H "Content-Type: application/x-ndjson" --data-binary $'{"query": "Check my balance"}\n{"query": "Pay 300 ZAR for water"}'
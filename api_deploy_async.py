@@ -0,0 +1,164 @@
+import json
+import os
+
+from aiohttp import web
+
+from api_deploy import (
+    SSE_HEADERS,
+    format_batch_results,
+    format_sse_event,
+    generation_batcher,
+    intent_batcher,
+    iter_ndjson_results,
+    iter_sse_events,
+    parse_batch_queries,
+)
+from inference_facebook_model import Infere
+from inference_base_nlp import Infere as IntentInfere
+from inference_momo_assistant import Infere as AssistantInfere
+from utils.exceptions import InferenceTimeoutError, ServerOverloadedError
+from utils.serving import BoundedInferencePool
+
+# Model calls run on a bounded pool so a slow generation never blocks the event loop
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 4))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", 32))
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", 10))
+
+pool = BoundedInferencePool(
+    max_workers=INFERENCE_WORKERS,
+    max_queue=MAX_QUEUED_REQUESTS,
+    timeout=REQUEST_TIMEOUT_S,
+)
+
+async def http_errors(awaitable):
+    try:
+        return await awaitable
+    except ServerOverloadedError as error:
+        raise web.HTTPServiceUnavailable(
+            text=error.message, headers={"Retry-After": "1"}
+        )
+    except InferenceTimeoutError as error:
+        raise web.HTTPGatewayTimeout(text=error.message)
+
+async def run_inference(fn, *args):
+    return await http_errors(pool.run(fn, *args))
+
+async def run_batched(batcher, item):
+    # Waiting for the batch holds a pool slot but no worker thread, so up to MAX_BATCH_SIZE requests can join it
+    return await http_errors(pool.run_batched(batcher, item))
+
+async def stream_response(request, lines, error_line, headers):
+    """Stream the strings of a blocking iterator, each one computed on the pool.
+
+    The pool slot is taken and the first line produced before the 200 status
+    is sent, so a saturated pool or a timeout before it still gets a 503 or a
+    504. Later failures, including the stream running past its single
+    deadline, end the body with `error_line(message)`.
+    """
+    lines = pool.iterate(lines)
+    try:
+        line = await http_errors(anext(lines, None))
+        response = web.StreamResponse(headers=headers)
+        await response.prepare(request)
+        while line is not None:
+            await response.write(line.encode())
+            try:
+                line = await anext(lines, None)
+            except Exception as error:
+                await response.write(error_line(getattr(error, "message", str(error))).encode())
+                break
+        await response.write_eof()
+        return response
+    finally:
+        # Frees the pool slot right away when the client disconnects mid-stream
+        await lines.aclose()
+
+async def predict(request):
+    data = await request.json()
+    user_query = data['query']
+    if data.get('model') == 'tinybert':
+        _, mapped_result = await run_batched(intent_batcher, user_query)
+    else:
+        mapped_result = await run_batched(generation_batcher, user_query)
+    return web.json_response(mapped_result)
+
+async def predict_stream(request):
+    data = await request.json()
+    # Each token is decoded on the pool and flushed as soon as it is ready
+    return await stream_response(
+        request,
+        iter_sse_events(data['query']),
+        lambda message: format_sse_event("error", {"error": message}),
+        {"Content-Type": "text/event-stream", **SSE_HEADERS},
+    )
+
+async def read_batch_request(request):
+    try:
+        return parse_batch_queries(await request.text(), ndjson=request.content_type == 'application/x-ndjson')
+    except (ValueError, KeyError, TypeError) as error:
+        raise web.HTTPBadRequest(text=str(error))
+
+async def predict_batch(request):
+    queries = await read_batch_request(request)
+    if not queries:
+        return web.json_response([])
+    results = await run_inference(IntentInfere.predict_batch, queries)
+    return web.json_response(format_batch_results(queries, results))
+
+async def predict_batch_stream(request):
+    queries = await read_batch_request(request)
+    # Advance the generator on the pool so each chunk's forward pass runs off the event loop
+    return await stream_response(
+        request,
+        iter_ndjson_results(queries),
+        lambda message: json.dumps({"error": message}) + "\n",
+        {"Content-Type": "application/x-ndjson"},
+    )
+
+async def chat(request):
+    data = await request.json()
+    result = await run_inference(AssistantInfere.answer, data['question'], data.get('history'))
+    return web.json_response(result)
+
+async def metrics(request):
+    return web.json_response({
+        "pool": pool.stats(),
+        "opt-125m": generation_batcher.stats(),
+        "opt-125m_generation": Infere.generation_stats(),
+        "tinybert": intent_batcher.stats(),
+        "tinybert_cache": IntentInfere.cache_stats(),
+        "tinybert_token_cache": IntentInfere.token_cache_stats(),
+        "tinybert_rules": IntentInfere.rule_stats(),
+        "momo_assistant": AssistantInfere.generation_stats(),
+        "momo_assistant_cache": AssistantInfere.cache_stats(),
+    })
+
+async def reload(request):
+    await run_inference(Infere.reload)
+    await run_inference(IntentInfere.reload)
+    await run_inference(AssistantInfere.reload)
+    return web.json_response({"status": "reloaded"})
+
+async def on_shutdown(app):
+    pool.shutdown()
+
+def create_app():
+    app = web.Application()
+    app.router.add_post('/predict', predict)
+    app.router.add_post('/predict/stream', predict_stream)
+    app.router.add_post('/predict/batch', predict_batch)
+    app.router.add_post('/predict/batch/stream', predict_batch_stream)
+    app.router.add_post('/chat', chat)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_post('/reload', reload)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+if __name__ == '__main__':
+    # Load the models before accepting traffic so the first request is not slowed down
+    Infere.warm_up()
+    IntentInfere.warm_up()
+    AssistantInfere.warm_up()
+    web.run_app(create_app(), host='0.0.0.0', port=5000)
+
+    # curl -X POST http://127.0.0.1:5000/predict -H "Content-Type: application/json" -d '{"query": "Send $50 to John"}'
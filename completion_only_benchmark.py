@@ -0,0 +1,140 @@
+import argparse
+import json
+import time
+
+import torch
+from datasets import Dataset
+from transformers import AutoModelForCausalLM, AutoTokenizer, TrainerCallback, TrainingArguments
+
+from utils.bucketed_trainer import BucketedTrainer
+from utils.bucketing import LengthBucketCollator
+from utils.instruction_tuning import tokenize_completion_only
+
+DATASET = 'mtn_chatbot_dataset.json'
+MODEL_NAME = "facebook/opt-125m"
+MAX_LENGTH = 128
+TARGET_ACCURACY = 0.95
+
+
+def load_examples(tokenizer, eval_samples, seed):
+    with open(DATASET) as f:
+        examples = json.load(f)
+    prompts = [f"{example['instruction']}\n{example['input']}\n" for example in examples]
+    completions = [example['output'] for example in examples]
+    encoded = tokenize_completion_only(tokenizer, prompts, completions, MAX_LENGTH)
+    dataset = Dataset.from_dict(dict(encoded)).shuffle(seed=seed)
+    return dataset.select(range(eval_samples, len(dataset))), dataset.select(range(eval_samples))
+
+
+def full_sequence_labels(dataset):
+    # Baseline: every token of instruction, input and output is in the loss, like labels = input_ids.copy()
+    return dataset.map(lambda example: {'labels': list(example['input_ids'])})
+
+
+def exact_match_accuracy(model, batches):
+    """Share of examples whose every answer token is the greedy prediction.
+
+    With teacher forcing this equals exact-match accuracy of greedy decoding,
+    at the cost of one forward pass per batch.
+    """
+    model.eval()
+    correct = total = 0
+    with torch.no_grad():
+        for batch in batches:
+            logits = model(input_ids=batch['input_ids'], attention_mask=batch['attention_mask']).logits
+            predicted = logits[:, :-1].argmax(dim=-1)
+            targets = batch['labels'][:, 1:]
+            answer = targets != -100
+            correct += ((predicted == targets) | ~answer).all(dim=-1).sum().item()
+            total += len(targets)
+    model.train()
+    return correct / total
+
+
+class TargetAccuracyCallback(TrainerCallback):
+    """Evaluates every `eval_every` steps and stops training once `target` is reached."""
+
+    def __init__(self, model, eval_batches, target, eval_every):
+        self.model = model
+        self.eval_batches = eval_batches
+        self.target = target
+        self.eval_every = eval_every
+        self.history = []
+        self.steps_to_target = None
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if state.global_step % self.eval_every:
+            return
+        accuracy = exact_match_accuracy(self.model, self.eval_batches)
+        self.history.append((state.global_step, accuracy))
+        print(f"step {state.global_step}: exact-match accuracy {accuracy:.2%}")
+        if accuracy >= self.target:
+            self.steps_to_target = state.global_step
+            control.should_training_stop = True
+
+
+def train_until_target(args, mode, tokenizer, train_dataset, eval_batches):
+    torch.manual_seed(args.seed)
+    model = AutoModelForCausalLM.from_pretrained(args.model_path)
+    callback = TargetAccuracyCallback(model, eval_batches, args.target_accuracy, args.eval_every)
+    training_args = TrainingArguments(
+        output_dir=f"./results/completion_only_benchmark/{mode}",
+        per_device_train_batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        max_steps=args.max_steps,
+        logging_steps=args.eval_every,
+        save_strategy="no",
+        report_to=[],
+        seed=args.seed,
+    )
+    trainer = BucketedTrainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        data_collator=LengthBucketCollator(tokenizer),
+        callbacks=[callback],
+    )
+    start = time.perf_counter()
+    trainer.train()
+    return {
+        'steps_to_target': callback.steps_to_target,
+        'final_accuracy': callback.history[-1][1] if callback.history else None,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Steps to a target exact-match accuracy, full-sequence loss vs completion-only loss"
+    )
+    parser.add_argument('--model-path', default=MODEL_NAME)
+    parser.add_argument('--target-accuracy', type=float, default=TARGET_ACCURACY)
+    parser.add_argument('--eval-every', type=int, default=25)
+    parser.add_argument('--eval-samples', type=int, default=200)
+    parser.add_argument('--max-steps', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--learning-rate', type=float, default=1e-5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    train_dataset, eval_dataset = load_examples(tokenizer, args.eval_samples, args.seed)
+    collator = LengthBucketCollator(tokenizer)
+    eval_batches = [collator(eval_dataset.select(range(start, min(start + 32, len(eval_dataset)))).to_list())
+                    for start in range(0, len(eval_dataset), 32)]
+
+    datasets = {'full sequence': full_sequence_labels(train_dataset), 'completion only': train_dataset}
+    results = {mode: train_until_target(args, mode, tokenizer, dataset, eval_batches) for mode, dataset in datasets.items()}
+
+    print(f"target exact-match accuracy {args.target_accuracy:.0%}, batch size {args.batch_size}")
+    print(f"{'loss':<18}{'steps to target':>16}{'final accuracy':>16}{'seconds':>9}")
+    for mode, result in results.items():
+        steps = result['steps_to_target'] if result['steps_to_target'] is not None else f">{args.max_steps}"
+        accuracy = f"{result['final_accuracy']:.2%}" if result['final_accuracy'] is not None else "-"
+        print(f"{mode:<18}{steps:>16}{accuracy:>16}{result['seconds']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
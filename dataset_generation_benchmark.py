@@ -0,0 +1,67 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from utils.synthetic_intents import ROW_FORMATS, SCHEMAS, iter_rows, iter_tables, sample_table, write_shard
+
+# Rows/s of the synthetic intent generators, per-row Python sampling against
+# NumPy/Arrow batch sampling, with and without writing a shard:
+#   python dataset_generation_benchmark.py --rows 1000000 --format instruction
+
+
+def per_row_tables(num_rows, seed, row_format, batch_size):
+    # The per-row sampler, batched into tables so that both paths share the writer
+    batch = []
+    for row in iter_rows(num_rows, seed, row_format):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield pa.Table.from_pylist(batch, SCHEMAS[row_format])
+            batch = []
+    if batch:
+        yield pa.Table.from_pylist(batch, SCHEMAS[row_format])
+
+
+def vectorized_tables(num_rows, seed, row_format, batch_size):
+    return iter_tables(num_rows, np.random.default_rng(seed), row_format, batch_size)
+
+
+SAMPLERS = {"per-row": per_row_tables, "vectorized": vectorized_tables}
+
+
+def run(sampler, num_rows, row_format, batch_size, file_format):
+    start = time.perf_counter()
+    tables = SAMPLERS[sampler](num_rows, 0, row_format, batch_size)
+    if file_format is None:
+        count = sum(table.num_rows for table in tables)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            count = write_shard(os.path.join(directory, f"shard.{file_format}"), tables, row_format)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rows/s of per-row against vectorized synthetic data generation")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--per-row-rows', type=int, default=200_000,
+                        help="Rows of the slower per-row runs")
+    parser.add_argument('--format', choices=sorted(ROW_FORMATS), default='instruction')
+    parser.add_argument('--batch-size', type=int, default=100_000)
+    args = parser.parse_args()
+
+    # Warm up imports and Arrow kernels
+    sample_table(np.random.default_rng(0), 1000, args.format)
+
+    print(f"{args.format} rows, one process")
+    print(f"{'output':<10}{'per-row rows/s':>16}{'vectorized rows/s':>19}{'speedup':>9}")
+    for file_format in (None, 'jsonl', 'parquet'):
+        per_row = run('per-row', args.per_row_rows, args.format, args.batch_size, file_format)
+        vectorized = run('vectorized', args.rows, args.format, args.batch_size, file_format)
+        print(f"{file_format or 'memory':<10}{per_row:>16,.0f}{vectorized:>19,.0f}{vectorized / per_row:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import glob
+import time
+
+from utils.dedup import DEDUP_THRESHOLD, NGRAM, NUM_PERM, NearDuplicateFilter, dedup_files, normalize_text, training_steps
+from utils.intent_templates import normalize_query
+
+OUTPUT_DIR = "./deduplicated"
+# Batch size and epochs of tinybert_finetuning.py, to count the training steps saved
+BATCH_SIZE = 16
+NUM_EPOCHS = 100
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drop exact and near-duplicate rows (MinHash/LSH) from intent datasets or their shards"
+    )
+    parser.add_argument('paths', nargs='*', default=['mtn_chatbot_dataset.csv'],
+                        help="CSV, JSON, JSONL or Parquet files or globs, e.g. 'synthetic_intents/*.parquet'")
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--threshold', type=float, default=DEDUP_THRESHOLD,
+                        help="Jaccard similarity of character n-grams from which rows are duplicates")
+    parser.add_argument('--max-per-intent', type=int, default=None, help="Rows kept per intent")
+    parser.add_argument('--num-perm', type=int, default=NUM_PERM)
+    parser.add_argument('--ngram', type=int, default=NGRAM)
+    parser.add_argument('--templates', action='store_true',
+                        help="Compare queries with amounts and names masked (utils.intent_templates.normalize_query)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Training batch size of the report")
+    parser.add_argument('--epochs', type=int, default=NUM_EPOCHS, help="Training epochs of the report")
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.paths for path in sorted(glob.glob(pattern))]
+    if not paths:
+        parser.error(f"no file matches {' '.join(args.paths)}")
+    dedup_filter = NearDuplicateFilter(
+        args.threshold, args.num_perm, args.ngram, args.max_per_intent,
+        normalize_query if args.templates else normalize_text,
+    )
+    start = time.perf_counter()
+    for path, output, kept in dedup_files(paths, args.output_dir, dedup_filter):
+        print(f"{path} -> {output}: {kept} rows kept")
+    elapsed = time.perf_counter() - start
+
+    stats = dedup_filter.stats()
+    rows, kept = stats["rows"], stats["kept"]
+    print(f"{rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s), {kept} kept: "
+          f"{stats['exact_duplicates']} exact duplicates, {stats['near_duplicates']} near duplicates "
+          f"(threshold {args.threshold}, {stats['lsh_bands']} bands of {stats['lsh_rows_per_band']}), "
+          f"{stats['capped']} over the per-intent cap")
+    for intent, count in stats["kept_per_intent"].items():
+        print(f"  {intent}: {count}")
+    before = training_steps(rows, args.batch_size, args.epochs)
+    after = training_steps(kept, args.batch_size, args.epochs)
+    print(f"Training steps at batch size {args.batch_size} for {args.epochs} epochs: "
+          f"{before} -> {after} ({before - after} saved, {1 - after / before:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,27 @@
 from transformers import AutoTokenizer, AutoModelForCausalLM
-from transformers import TrainingArguments, Trainer, DataCollatorForLanguageModeling
-from datasets import load_dataset
+from transformers import TrainingArguments
+
+from utils.bucketed_trainer import BucketedTrainer
+from utils.bucketing import LengthBucketCollator
+from utils.columnar import dataset_path
+from utils.instruction_tuning import tokenize_completion_only
+from utils.packing import PackedSequenceCollator, pack_dataset
+from utils.tokenized_cache import load_tokenized
 
 # Load OPT-125M
 model_name = "facebook/opt-125m"
 FINETUNED_MODEL = "./fine-tuned-opt-125m"
-DATASET = 'mtn_chatbot_dataset.json'
+# Typed Arrow copy of mtn_chatbot_dataset.json, converted on first use
+DATASET = dataset_path('instructions')
 TRAINING_LOGS = "./logs"
 TRAINING_RESULTS = "./results"
 NUM_EPOCHS = 10
 LEARNING_RATE = 1e-5
+MAX_LENGTH = 128
+# Concatenate several examples into each MAX_LENGTH row instead of padding every example
+PACKING = True
+# Leave the instruction and the query out of the loss, only the JSON answer is learned
+COMPLETION_ONLY = True
 
 tokenizer = AutoTokenizer.from_pretrained(model_name)
 model = AutoModelForCausalLM.from_pretrained(model_name)
@@ -17,19 +29,14 @@ model = AutoModelForCausalLM.from_pretrained(model_name)
 if tokenizer.pad_token is None:
     tokenizer.pad_token = tokenizer.eos_token
 
-# Loading the dataset
-dataset = load_dataset('json', data_files = DATASET)
-
-# First data point
-print("Dataset structure:", dataset)
-print("First example:", dataset['train'][0] if 'train' in dataset else next(iter(dataset.values()))[0])
-print("Column names:", dataset['train'].column_names if 'train' in dataset else next(iter(dataset.values())).column_names)
-
 def tokenize_function(examples):
     if 'text' in examples:
         texts = examples['text']
     elif 'instruction' in examples:
         if 'input' in examples and 'output' in examples:
+            if COMPLETION_ONLY:
+                prompts = [f"{inst}\n{inp}\n" for inst, inp in zip(examples['instruction'], examples['input'])]
+                return tokenize_completion_only(tokenizer, prompts, examples['output'], MAX_LENGTH)
             texts = [f"{inst}\n{inp}\n{out}" for inst, inp, out in 
                    zip(examples['instruction'], examples['input'], examples['output'])]
         elif 'output' in examples:
@@ -44,28 +51,30 @@ def tokenize_function(examples):
                                and isinstance(examples[k][0], str)), None)
         texts = examples[first_text_field] if first_text_field else ["Placeholder text"]
         
+    # Truncate only, each batch is padded to its longest example by the collator
     result = tokenizer(
         texts,
-        padding="max_length",
         truncation=True,
-        max_length=128,
+        max_length=MAX_LENGTH,
     )
     
     result["labels"] = result["input_ids"].copy()
     
     return result
 
-# Batched processing
-tokenized_datasets = dataset.map(
-    tokenize_function, 
-    batched=True,
-    remove_columns=dataset['train'].column_names if 'train' in dataset else next(iter(dataset.values())).column_names
+# Batched processing, or memory-mapped from a previous run with the same data, tokenizer and code
+tokenized_dataset = load_tokenized(
+    DATASET, tokenize_function, tokenizer, MAX_LENGTH, extra={"completion_only": COMPLETION_ONLY}
 )
+print("Tokenized dataset:", tokenized_dataset)
 
-data_collator = DataCollatorForLanguageModeling(
-    tokenizer=tokenizer, 
-    mlm=False  # We're doing causal LM, not masked LM
-)
+if PACKING:
+    # Each example only attends to itself and its first token is left out of the loss
+    tokenized_dataset = pack_dataset(tokenized_dataset, MAX_LENGTH)
+    data_collator = PackedSequenceCollator(tokenizer)
+else:
+    # Labels are the input ids, padding positions are set to -100 so the loss skips them
+    data_collator = LengthBucketCollator(tokenizer)
 
 training_args = TrainingArguments(
     output_dir=TRAINING_RESULTS,
@@ -78,10 +87,10 @@ training_args = TrainingArguments(
     logging_steps=10,
 )
 
-trainer = Trainer(
+trainer = BucketedTrainer(
     model=model,
     args=training_args,
-    train_dataset=tokenized_datasets['train'] if 'train' in tokenized_datasets else next(iter(tokenized_datasets.values())),
+    train_dataset=tokenized_dataset,
     data_collator=data_collator,  
 )
 
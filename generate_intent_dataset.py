@@ -0,0 +1,32 @@
+import argparse
+import time
+
+from utils.synthetic_intents import ROW_FORMATS, generate_shards
+
+OUTPUT_DIR = "./synthetic_intents"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream synthetic intent queries to sharded JSONL/Parquet files")
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Rows over all shards")
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--format', choices=sorted(ROW_FORMATS), default='instruction',
+                        help="csv: mtn_chatbot_dataset.csv columns, instruction: mtn_chatbot_dataset.json fields")
+    parser.add_argument('--file-format', choices=['jsonl', 'parquet'], default='parquet')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="Processes, one per CPU by default")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    shards = generate_shards(
+        args.rows, args.shards, args.output_dir, args.format, args.file_format, args.seed, args.workers
+    )
+    elapsed = time.perf_counter() - start
+    total = sum(rows for _, rows in shards)
+    print(f"Wrote {total} rows to {len(shards)} shards in {args.output_dir} "
+          f"in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
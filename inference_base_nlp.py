@@ -1,5 +1,32 @@
-from transformers import pipeline
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+import torch
 import json
+import os
+
+from utils.bucketing import LengthBucketSampler
+from utils.cache import LRUCache
+from utils.exceptions import OnnxRuntimeNotInstalledError
+from utils.intent_rules import RuleAgreement, TemplateMatcher
+from utils.intent_templates import normalize_query
+from utils.model_registry import registry
+from utils.quantization import load_int8
+
+TINYBERT_MODEL = './fine-tuned-tinybert'
+# Graphs written by tinybert_export.py next to the fine-tuned weights
+TORCHSCRIPT_FILE = 'model.torchscript.pt'
+ONNX_FILE = 'model.onnx'
+# "eager", "torchscript" or "onnx"
+BACKEND = os.getenv("TINYBERT_BACKEND", "eager")
+WARM_UP_QUERY = "Check my balance"
+# Same limit the classifier was fine-tuned with in tinybert_finetuning.py
+MAX_QUERY_TOKENS = 64
+# Results are cached per normalized query, see utils.intent_templates.normalize_query
+RESULT_CACHE_SIZE = 4096
+RESULT_CACHE_TTL_S = 3600
+# Token ids per raw query text, so repeated queries skip the tokenizer
+TOKEN_CACHE_SIZE = int(os.getenv("TINYBERT_TOKEN_CACHE_SIZE", 16384))
+# "fast_path": templated queries skip the model, "compare": run both and count agreement, "off": model only
+RULE_MODE = os.getenv("INTENT_RULE_MODE", "fast_path")
 
 # Load the action to label mapping
 with open('action_to_label.json', 'r') as f:
@@ -23,16 +50,248 @@ def map_label_to_action(result):
         "confidence": result[0]['score']
     }  
 
+class TinyBertClassifier:
+    """Fine-tuned TinyBERT tokenizer and model, called like the text-classification pipeline.
+
+    A list of queries is tokenized in one call and split into length buckets,
+    each padded to its longest member and classified in one forward pass
+    (a single pass for typical short queries). Token ids are cached per raw
+    query text, and `classify_ids` takes already tokenized queries. Subclasses
+    swap the eager PyTorch model for an exported graph by overriding
+    `load_model` and `logits`.
+    """
+
+    def __init__(self, model_path=TINYBERT_MODEL):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.config = AutoConfig.from_pretrained(model_path)
+        self.model = self.load_model(model_path)
+        self.token_cache = LRUCache(maxsize=TOKEN_CACHE_SIZE)
+
+    def load_model(self, model_path):
+        # Prefer the int8 weights written by quantize_models.py when they passed the accuracy gate
+        model = load_int8(AutoModelForSequenceClassification, model_path)
+        if model is None:
+            model = AutoModelForSequenceClassification.from_pretrained(model_path)
+        model.eval()
+        return model
+
+    def tokenize(self, queries):
+        """Token ids (with [CLS] and [SEP]) for each query, tokenizing only unseen texts."""
+        token_ids = [self.token_cache.get(query) for query in queries]
+        misses = list(dict.fromkeys(query for query, ids in zip(queries, token_ids) if ids is None))
+        if misses:
+            encoded = self.tokenizer(misses, truncation=True, max_length=MAX_QUERY_TOKENS)['input_ids']
+            fresh = dict(zip(misses, map(tuple, encoded)))
+            for query, ids in fresh.items():
+                self.token_cache.put(query, ids)
+            token_ids = [fresh[query] if ids is None else ids for query, ids in zip(queries, token_ids)]
+        return token_ids
+
+    def check_token_ids(self, token_ids):
+        """Return `token_ids` as a tuple of ints, raising ValueError if the model cannot take it."""
+        token_ids = tuple(int(token_id) for token_id in token_ids)
+        if not 0 < len(token_ids) <= MAX_QUERY_TOKENS:
+            raise ValueError(f"Expected between 1 and {MAX_QUERY_TOKENS} token ids, got {len(token_ids)}")
+        if min(token_ids) < 0 or max(token_ids) >= self.config.vocab_size:
+            raise ValueError(f"Token ids must be in [0, {self.config.vocab_size})")
+        return token_ids
+
+    def pad(self, token_ids):
+        """Right-pad id sequences to the longest one and build the model inputs."""
+        lengths = [len(ids) for ids in token_ids]
+        length = max(lengths)
+        padding = (self.tokenizer.pad_token_id,)
+        input_ids = torch.tensor([tuple(ids) + padding * (length - len(ids)) for ids in token_ids], dtype=torch.long)
+        attention_mask = (torch.arange(length) < torch.tensor(lengths)[:, None]).long()
+        return {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'token_type_ids': torch.zeros_like(input_ids),
+        }
+
+    def encode(self, queries):
+        return self.pad(self.tokenize(list(queries)))
+
+    def logits(self, encoded):
+        with torch.no_grad():
+            return self.model(**encoded).logits
+
+    def __call__(self, queries):
+        if isinstance(queries, str):
+            return self([queries])[:1]
+        return self.classify_ids(self.tokenize(list(queries)))
+
+    def classify_ids(self, token_ids):
+        # One forward pass per length bucket, so a long query does not pad all the short ones
+        results = [None] * len(token_ids)
+        id2label = self.config.id2label
+        for batch in LengthBucketSampler([len(ids) for ids in token_ids], len(token_ids), shuffle=False):
+            logits = self.logits(self.pad([token_ids[row] for row in batch]))
+            scores, indices = logits.softmax(dim=-1).max(dim=-1)
+            for row, index, score in zip(batch, indices.tolist(), scores.tolist()):
+                results[row] = {'label': id2label[index], 'score': score}
+        return results
+
+class TorchScriptTinyBertClassifier(TinyBertClassifier):
+    """Runs the traced graph written by `tinybert_export.py --format torchscript`."""
+
+    def load_model(self, model_path):
+        model = torch.jit.load(os.path.join(model_path, TORCHSCRIPT_FILE))
+        model.eval()
+        return model
+
+    def logits(self, encoded):
+        with torch.no_grad():
+            return self.model(encoded['input_ids'], encoded['attention_mask'], encoded['token_type_ids'])[0]
+
+class OnnxTinyBertClassifier(TinyBertClassifier):
+    """Runs the graph written by `tinybert_export.py --format onnx` on ONNX Runtime."""
+
+    def load_model(self, model_path):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise OnnxRuntimeNotInstalledError()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return onnxruntime.InferenceSession(
+            os.path.join(model_path, ONNX_FILE), options, providers=['CPUExecutionProvider']
+        )
+
+    def logits(self, encoded):
+        inputs = {name: encoded[name].numpy() for name in ('input_ids', 'attention_mask', 'token_type_ids')}
+        return torch.from_numpy(self.model.run(['logits'], inputs)[0])
+
+BACKENDS = {
+    "eager": TinyBertClassifier,
+    "torchscript": TorchScriptTinyBertClassifier,
+    "onnx": OnnxTinyBertClassifier,
+}
+
+def load_classifier():
+    if BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown TinyBERT backend '{BACKEND}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[BACKEND](TINYBERT_MODEL)
+
+registry.register(TINYBERT_MODEL, load_classifier)
+
+result_cache = LRUCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_S)
+
+@registry.on_reload
+def invalidate_result_cache(name):
+    # Cached answers came from the previous weights
+    if name == TINYBERT_MODEL:
+        result_cache.clear()
+
+template_matcher = TemplateMatcher()
+rule_agreement = RuleAgreement()
+
+def rule_result(rule_match):
+    # Same shape as the classifier output, with full confidence for an exact template match
+    result = [{'label': f"LABEL_{action_to_label[rule_match['intent']]}", 'score': 1.0}]
+    return result, map_label_to_action(result)
+
 class Infere:
 
     # Function to map label to action
     @staticmethod
     def predict(query):
-        # Load the fine-tuned model
-        classifier = pipeline('text-classification', model='./fine-tuned-tinybert')
-        result = classifier(query)
-        mapped_result = map_label_to_action(result)
-        return result ,mapped_result
+        return Infere.predict_batch([query])[0]
+
+    @staticmethod
+    def predict_batch(queries):
+        rule_matches = [None] * len(queries)
+        if RULE_MODE in ("fast_path", "compare"):
+            rule_matches = [template_matcher.match(query) for query in queries]
+            for rule_match in rule_matches:
+                rule_agreement.record_lookup(rule_match is not None)
+        if RULE_MODE == "fast_path":
+            model_queries = [query for query, rule_match in zip(queries, rule_matches) if rule_match is None]
+            model_outputs = iter(Infere._predict_with_model(model_queries))
+            return [
+                rule_result(rule_match) if rule_match is not None else next(model_outputs)
+                for rule_match in rule_matches
+            ]
+        outputs = Infere._predict_with_model(queries)
+        if RULE_MODE == "compare":
+            for query, rule_match, (_, mapped_result) in zip(queries, rule_matches, outputs):
+                if rule_match is not None:
+                    rule_agreement.record_comparison(query, rule_match['intent'], mapped_result['action'])
+        return outputs
+
+    @staticmethod
+    def tokenize(queries):
+        """Token ids for each query, for callers that want to tokenize once and reuse the ids."""
+        return [list(ids) for ids in registry.get(TINYBERT_MODEL).tokenize(list(queries))]
+
+    @staticmethod
+    def predict_ids(token_ids):
+        return Infere.predict_batch_ids([token_ids])[0]
+
+    @staticmethod
+    def predict_batch_ids(token_ids):
+        """Classify pre-tokenized queries, e.g. the output of `Infere.tokenize`.
+
+        Each item is a sequence of token ids (list, tuple or 1-d array)
+        including [CLS] and [SEP]. Template rules do not apply since there is
+        no text, and results are cached per id sequence.
+        """
+        classifier = registry.get(TINYBERT_MODEL)
+        keys = [classifier.check_token_ids(ids) for ids in token_ids]
+        return Infere._cached_predict(keys, keys, lambda classifier, inputs: classifier.classify_ids(inputs))
+
+    @staticmethod
+    def _predict_with_model(queries):
+        keys = [normalize_query(query) for query in queries]
+        return Infere._cached_predict(keys, queries, lambda classifier, inputs: classifier(inputs))
+
+    @staticmethod
+    def _cached_predict(keys, inputs, classify):
+        # Repeated keys are answered from the cache, the rest share one padded forward pass
+        outputs = {}
+        misses = {}
+        for key, item in zip(keys, inputs):
+            if key in outputs or key in misses:
+                continue
+            output = result_cache.get(key)
+            if output is None:
+                misses[key] = item
+            else:
+                outputs[key] = output
+        if misses:
+            # The fine-tuned model is loaded once and kept resident in the registry
+            classifier = registry.get(TINYBERT_MODEL)
+            for key, result in zip(misses, classify(classifier, list(misses.values()))):
+                outputs[key] = ([result], map_label_to_action([result]))
+                result_cache.put(key, outputs[key])
+        # Copies, so callers cannot alter what is cached
+        return [([dict(outputs[key][0][0])], dict(outputs[key][1])) for key in keys]
+
+    @staticmethod
+    def cache_stats():
+        return result_cache.stats()
+
+    @staticmethod
+    def token_cache_stats():
+        # Reported without loading the model just for the metrics
+        if not registry.is_loaded(TINYBERT_MODEL):
+            return None
+        return registry.get(TINYBERT_MODEL).token_cache.stats()
+
+    @staticmethod
+    def rule_stats():
+        return dict(rule_agreement.stats(), mode=RULE_MODE)
+
+    @staticmethod
+    def warm_up():
+        # Load the model and run one query so the first request does not pay for it
+        registry.warm_up(TINYBERT_MODEL)
+        Infere.predict(WARM_UP_QUERY)
+
+    @staticmethod
+    def reload():
+        # Pick up a newly saved ./fine-tuned-tinybert without restarting the process
+        registry.reload(TINYBERT_MODEL)
 
     
 # Test the model with mapping
@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+import time
+
+import ollama
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from utils.constants import MTN_MOMO_SYSTEM_PROMPT
+from utils.model_registry import registry
+from utils.semantic_cache import SemanticCache
+
+# The fine-tuned Llama-3.1 assistant, pushed as GGUF by momo_conversational_finetune.py and
+# served by Ollama (the client reads OLLAMA_HOST, which can point at stub_ollama_server.py)
+ASSISTANT_MODEL = os.getenv("MOMO_ASSISTANT_MODEL", "hf.co/JulienNyambal/mtn_momo_bot")
+# Opt-in (MOMO_SEMANTIC_CACHE=1): the threshold below has not been calibrated on real paraphrase and
+# non-paraphrase pairs yet, and mean-pooled TinyBERT_General embeddings are not trained for sentence
+# similarity, so a different financial question could get a cached answer
+USE_SEMANTIC_CACHE = os.getenv("MOMO_SEMANTIC_CACHE", "0") == "1"
+# Questions are embedded with the TinyBERT backbone to look up answers to paraphrased repeats
+ENCODER_MODEL = os.getenv("SEMANTIC_CACHE_ENCODER", "huawei-noah/TinyBERT_General_4L_312D")
+SEMANTIC_CACHE = ENCODER_MODEL + "#semantic-cache"
+MAX_QUESTION_TOKENS = 64
+# Smallest cosine similarity of a cached question to reuse its answer, to calibrate per encoder
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 4096))
+SEMANTIC_CACHE_TTL_S = float(os.getenv("SEMANTIC_CACHE_TTL_S", 86400))
+
+# Amounts, phone numbers and dates, which must match for a cached answer to apply
+_NUMBER_PATTERN = re.compile(r"\d[\d,.]*")
+
+
+def question_numbers(question):
+    return tuple(number.replace(",", "").rstrip(".") for number in _NUMBER_PATTERN.findall(question))
+
+
+class TinyBertEncoder:
+    """TinyBERT backbone used as a sentence encoder.
+
+    The last hidden states are averaged over the real tokens of each text
+    and L2-normalized, so the dot product of two embeddings is their cosine
+    similarity.
+    """
+
+    def __init__(self, model_path=ENCODER_MODEL):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.model = AutoModel.from_pretrained(model_path)
+        self.model.eval()
+        self.dim = self.model.config.hidden_size
+
+    def __call__(self, texts):
+        encoded = self.tokenizer(
+            list(texts), padding=True, truncation=True, max_length=MAX_QUESTION_TOKENS, return_tensors="pt"
+        )
+        with torch.inference_mode():
+            hidden = self.model(**encoded).last_hidden_state
+        mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        embeddings = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return torch.nn.functional.normalize(embeddings, dim=-1).numpy()
+
+
+def load_encoder():
+    return TinyBertEncoder(ENCODER_MODEL)
+
+def load_semantic_cache():
+    encoder = registry.get(ENCODER_MODEL)
+    return SemanticCache(
+        encoder,
+        encoder.dim,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        maxsize=SEMANTIC_CACHE_SIZE,
+        ttl=SEMANTIC_CACHE_TTL_S,
+        guard=question_numbers,
+    )
+
+registry.register(ENCODER_MODEL, load_encoder)
+registry.register(SEMANTIC_CACHE, load_semantic_cache)
+
+
+class GenerationStats:
+    """Calls to the assistant model and their total duration, to estimate what cache hits save."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.generations = 0
+        self.generation_s = 0.0
+        self.cached_answers = 0
+
+    def record_generation(self, seconds):
+        with self._lock:
+            self.generations += 1
+            self.generation_s += seconds
+
+    def record_cached_answer(self):
+        with self._lock:
+            self.cached_answers += 1
+
+    def as_dict(self):
+        with self._lock:
+            mean_s = self.generation_s / self.generations if self.generations else None
+            return {
+                "model": ASSISTANT_MODEL,
+                "generations": self.generations,
+                "mean_generation_s": round(mean_s, 4) if mean_s is not None else None,
+                "cached_answers": self.cached_answers,
+                "estimated_generation_s_saved": round(mean_s * self.cached_answers, 2) if mean_s else None,
+            }
+
+
+generation_stats = GenerationStats()
+
+
+def generate_answer(question, history=()):
+    messages = [{"role": "system", "content": MTN_MOMO_SYSTEM_PROMPT}, *history, {"role": "user", "content": question}]
+    start = time.perf_counter()
+    response = ollama.chat(model=ASSISTANT_MODEL, messages=messages)
+    generation_stats.record_generation(time.perf_counter() - start)
+    return response["message"]["content"]
+
+
+class Infere:
+
+    @staticmethod
+    def answer(question, history=None):
+        """Answer a customer question, reusing the answer to a similar earlier question when there is one.
+
+        The semantic cache is only used when enabled with MOMO_SEMANTIC_CACHE=1,
+        and only for standalone questions: with a `history` (earlier
+        `{"role", "content"}` messages), the answer depends on the
+        conversation, as for "Yes, please." or "PIN entered.", so it is always
+        generated.
+
+        Returns:
+            dict: The answer, whether it came from the cache, and the
+                similarity and question of the cached entry it came from.
+        """
+        if history or not USE_SEMANTIC_CACHE:
+            return {"answer": generate_answer(question, history or ()), "cached": False}
+        # Concurrent misses on similar questions share one generation
+        answer, match = registry.get(SEMANTIC_CACHE).get_or_compute(question, generate_answer)
+        if match is None:
+            return {"answer": answer, "cached": False}
+        similarity, cached_question = match
+        generation_stats.record_cached_answer()
+        return {
+            "answer": answer,
+            "cached": True,
+            "similarity": round(similarity, 4),
+            "cached_question": cached_question,
+        }
+
+    @staticmethod
+    def cache_stats():
+        # Reported without loading the encoder just for the metrics
+        if not registry.is_loaded(SEMANTIC_CACHE):
+            return None
+        return registry.get(SEMANTIC_CACHE).stats()
+
+    @staticmethod
+    def generation_stats():
+        return generation_stats.as_dict()
+
+    @staticmethod
+    def warm_up():
+        if USE_SEMANTIC_CACHE:
+            registry.warm_up(ENCODER_MODEL, SEMANTIC_CACHE)
+        # A chat without messages makes Ollama load the model without generating anything
+        try:
+            ollama.chat(model=ASSISTANT_MODEL, messages=[])
+        except (ollama.ResponseError, ConnectionError) as error:
+            # The other endpoints do not need Ollama, so the server still starts
+            print(f"Could not preload {ASSISTANT_MODEL}: {error}")
+
+    @staticmethod
+    def reload():
+        # Answers cached from the previous model version are dropped
+        if registry.is_loaded(SEMANTIC_CACHE):
+            registry.get(SEMANTIC_CACHE).clear()
@@ -1,6 +1,14 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer
+from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments
 import torch
-from datasets import load_dataset
+
+from utils.bucketed_trainer import BucketedTrainer
+from utils.bucketing import LengthBucketCollator
+from utils.columnar import dataset_path
+from utils.tokenized_cache import load_tokenized
+
+# Typed Arrow copy of mtn_chatbot_dataset.json, converted on first use
+DATASET = dataset_path('instructions')
+MAX_LENGTH = 512
 
 # Load Mistral 7B for CPU (no quantization)
 model_name = "mistralai/Mistral-7B-v0.1"
@@ -16,43 +24,30 @@ model = AutoModelForCausalLM.from_pretrained(
 )
 print("Model downloaded successfully")
 
-# Load your dataset
-print("Loading dataset...")
-dataset = load_dataset('json', data_files='mtn_chatbot_dataset.json')
-print("Dataset loaded")
-
 # Ensure tokenizer has proper padding token
 if tokenizer.pad_token is None:
     tokenizer.pad_token = tokenizer.eos_token
 
 # Tokenize the dataset
 def tokenize_function(examples):
-    # Adjust based on your actual dataset structure
-    # Print an example to see structure
-    print("Dataset example:", examples[0] if len(examples) > 0 else "Empty")
+    # `examples` is a batch: a dict of columns
+    if 'input' in examples:
+        inputs = [f"{instruction}\n{inp}" for instruction, inp in zip(examples['instruction'], examples['input'])]
+    else:
+        inputs = examples['instruction']
     
-    # Adapt this based on your dataset structure
-    inputs = [f"{ex['instruction']}\n{ex['input']}" if 'input' in ex else ex['instruction'] 
-              for ex in examples]
-    
-    return tokenizer(
+    # Truncate only, each batch is padded to its longest example by the collator
+    result = tokenizer(
         inputs,
-        padding="max_length",
         truncation=True,
-        max_length=512
+        max_length=MAX_LENGTH
     )
+    result["labels"] = result["input_ids"].copy()
+    return result
 
-# First check dataset structure before mapping
-print("Dataset structure check:", dataset.keys())
-print("First example:", dataset['train'][0] if 'train' in dataset else next(iter(dataset.values()))[0])
-
-# Map tokenization
-tokenized_datasets = dataset['train'].map(
-    tokenize_function, 
-    batched=True,
-    remove_columns=dataset['train'].column_names  # Remove all original columns
-)
-print("Dataset tokenized")
+# Map tokenization, or memory-map the result of a previous run with the same data, tokenizer and code
+tokenized_datasets = load_tokenized(DATASET, tokenize_function, tokenizer, MAX_LENGTH)
+print("Dataset tokenized:", tokenized_datasets)
 
 # Define training arguments for CPU
 training_args = TrainingArguments(
@@ -69,11 +64,12 @@ training_args = TrainingArguments(
     no_cuda=True                   # Explicitly disable CUDA
 )
 
-# Define the Trainer
-trainer = Trainer(
+# Define the Trainer, batches are drawn from length buckets
+trainer = BucketedTrainer(
     model=model,
     args=training_args,
     train_dataset=tokenized_datasets,
+    data_collator=LengthBucketCollator(tokenizer),
 )
 
 # Fine-tune the model
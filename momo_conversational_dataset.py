@@ -1,6 +1,15 @@
+import asyncio
+import os
+
 from datasets import load_dataset, Dataset
-from tqdm import tqdm
+import numpy as np
 import ollama
+import pyarrow as pa
+
+from utils.async_pipeline import run_ordered
+from utils.columnar import DATASETS, load_hf_dataset
+from utils.constants import MTN_MOMO_SYSTEM_PROMPT
+from utils.llm_cache import LLMResultCache
 
 # # Load the local CSV file
 # dataset = load_dataset('csv', data_files='momo_conversations.csv', split='train')
@@ -8,8 +17,17 @@ import ollama
 # # Inspect the dataset
 # print(dataset[35])  # Print the first row
 
-MTN_MOMO_SYSTEM_PROMPT = """You are the MTN Mobile Money virtual assistant for Uganda. Be helpful, professional, and knowledgeable about all MTN Mobile Money services. Use clear, simple language and provide accurate information about savings, loans, transfers, and account services.
-Always verify user identity for sensitive operations, offer relevant financial advice, and suggest appropriate MTN products based on the customer's needs and usage patterns. Maintain a friendly but professional tone, and prioritize educating customers about financial services while ensuring security compliance."""
+# Change OLLAMA_MODEL to "llama3" or another available model in Ollama.
+# The clients read OLLAMA_HOST, which can point at stub_ollama_server.py.
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# Requests in flight at once, and retries of a failed request with exponential backoff
+CLEANING_CONCURRENCY = int(os.getenv("CLEANING_CONCURRENCY", 8))
+CLEANING_RETRIES = int(os.getenv("CLEANING_RETRIES", 4))
+CLEANING_BACKOFF_S = 1.0
+# Cleaned turns are kept per hash(prompt, model, text), so reruns only clean unseen turns.
+# Results are committed every CLEANING_CHECKPOINT_EVERY turns.
+CLEANING_CACHE = os.getenv("CLEANING_CACHE", "./mtn_bot_dataset/cleaning_cache.sqlite")
+CLEANING_CHECKPOINT_EVERY = int(os.getenv("CLEANING_CHECKPOINT_EVERY", 100))
 
 CLEANING_PROMPT = """
 Your task is to standardize MTN Mobile Money conversational data.
@@ -25,7 +43,7 @@ Input: checks loan eligibility. Based on your transaction history, you qualify f
 Output: Based on your transaction history, you qualify for a loan of up to UGX 300,000 with a 30-day repayment period.
 """
 
-def load_mtn_mobile_money_dataset(dataset_location='dataset/mtn-mobile-money-conversations-*'):
+def load_mtn_mobile_money_dataset(dataset_location='dataset/mtn-mobile-money-conversations-*.csv'):
     """Loads the MTN Mobile Money conversation dataset.
 
     This function loads the MTN Mobile Money conversation dataset from the specified
@@ -37,6 +55,9 @@ def load_mtn_mobile_money_dataset(dataset_location='dataset/mtn-mobile-money-con
             scenario type (Savings, Loans, Remittance, Money Transfers, Account Status),
             and conversation ID.
     """
+    if dataset_location == DATASETS["momo_dialogues"][0]:
+        # Memory-mapped from the typed Arrow copy of the CSVs, see utils/columnar.py
+        return load_hf_dataset("momo_dialogues")
     # Load the local CSV file
     dataset = load_dataset('csv', data_files=dataset_location, split='train')
     return dataset
@@ -46,7 +67,9 @@ def create_conversation_pairs(dataset):
 
     This function processes the dataset to create conversation pairs where a Customer
     message is followed by the Bot's response. Each conversation includes a system prompt
-    defining the Bot's personality and purpose.
+    defining the Bot's personality and purpose. Rows are grouped by conversation_id with
+    a stable sort (conversations in order of first appearance, turns in dataset order) and
+    paired by comparing each row with the next one, column-wise.
 
     Args:
         dataset (datasets.Dataset): The MTN Mobile Money dataset containing dialogue,
@@ -62,37 +85,41 @@ def create_conversation_pairs(dataset):
                 ]
             }
     """
-    new_rows = []
-    # Group by conversation_id to handle multi-turn conversations
-    conversation_groups = {}
-
-    for i in tqdm(range(len(dataset))):
-        row = dataset[i]
-        conv_id = row["conversation_id"]
-
-        if conv_id not in conversation_groups:
-            conversation_groups[conv_id] = []
-        conversation_groups[conv_id].append(row)
-
-    # Process each conversation
-    for conv_id, conversation in conversation_groups.items():
-        for i in range(len(conversation) - 1):
-            current_row = conversation[i]
-            next_row = conversation[i + 1]
-
-            if current_row["speaker"] == "Customer" and next_row["speaker"] == "Bot":
-                new_rows.append(
-                    {
-                        "conversations_raw": [
-                            {"from": "system", "value": MTN_MOMO_SYSTEM_PROMPT.strip()},
-                            {"from": "human", "value": current_row["dialogue"].strip()},
-                            {"from": "gpt", "value": next_row["dialogue"].strip()},
-                        ],
-                        "scenario_type": current_row["scenario_type"]
-                    }
-                )
-
-    return Dataset.from_list(new_rows)
+    df = dataset.select_columns(["conversation_id", "scenario_type", "speaker", "dialogue"]).to_pandas()
+    # Group by conversation_id to handle multi-turn conversations, keeping the original order
+    group = df["conversation_id"].factorize()[0]
+    df = df.iloc[np.argsort(group, kind="stable")].reset_index(drop=True)
+
+    # A pair is a Customer row followed by a Bot row of the same conversation
+    next_row = df.shift(-1)
+    is_pair = (
+        (df["speaker"] == "Customer")
+        & (next_row["speaker"] == "Bot")
+        & (df["conversation_id"] == next_row["conversation_id"])
+    ).to_numpy()
+    human = df["dialogue"][is_pair].fillna("").str.strip().to_numpy(dtype=object)
+    gpt = next_row["dialogue"][is_pair].fillna("").str.strip().to_numpy(dtype=object)
+
+    # Built as Arrow arrays directly, three turns per row
+    values = np.empty(3 * len(human), dtype=object)
+    values[0::3] = MTN_MOMO_SYSTEM_PROMPT.strip()
+    values[1::3] = human
+    values[2::3] = gpt
+    turns = pa.StructArray.from_arrays(
+        [pa.array(np.tile(["system", "human", "gpt"], len(human)), pa.string()), pa.array(values, pa.string())],
+        names=["from", "value"],
+    )
+    offsets = pa.array(np.arange(0, 3 * len(human) + 1, 3, dtype=np.int32))
+    return Dataset(pa.table({
+        "conversations_raw": pa.ListArray.from_arrays(offsets, turns),
+        "scenario_type": pa.array(df["scenario_type"][is_pair].to_numpy(dtype=object), pa.string()),
+    }))
+
+def cleaning_messages(text, system_prompt):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": text.strip()},
+    ]
 
 def clean_dialogue(text, system_prompt):
     """Clean a single dialogue using Ollama.
@@ -104,23 +131,88 @@ def clean_dialogue(text, system_prompt):
     Returns:
         str: The cleaned dialogue text with actions/context removed.
     """
-    response = ollama.chat(
-        model="mistral",  # Change this to "llama3" or another available model in Ollama
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": text.strip()},
-        ]  # Lower temperature for more deterministic responses
-    )
+    response = ollama.chat(model=OLLAMA_MODEL, messages=cleaning_messages(text, system_prompt))
 
     return response["message"]["content"]  # Extracts the chatbot's reply
 
+async def clean_dialogue_async(client, text, system_prompt):
+    """Clean a single dialogue with an `ollama.AsyncClient`, see `clean_dialogue`."""
+    response = await client.chat(model=OLLAMA_MODEL, messages=cleaning_messages(text, system_prompt))
+    return response["message"]["content"]
+
+def is_retryable(error):
+    # Client errors such as an unknown model will not go away on retry, rate limiting and server errors may
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code == 429 or not 400 <= error.status_code < 500
+    return True
+
+async def clean_texts(texts, system_prompt, concurrency=CLEANING_CONCURRENCY, host=None, cache=None,
+                      checkpoint_every=CLEANING_CHECKPOINT_EVERY):
+    """Clean many dialogue texts concurrently, returning them in the input order.
 
-def clean_conversations(dataset):
+    Identical texts are cleaned once. With a cache, texts cleaned by an
+    earlier run with the same prompt and model are not sent again, and new
+    results are committed every `checkpoint_every` turns and when the run
+    stops, even on an error.
+
+    Args:
+        texts (list): Dialogue texts to clean.
+        system_prompt (str): The system prompt providing instructions for cleaning.
+        concurrency (int): Largest number of Ollama requests in flight.
+        host (str): Ollama server, OLLAMA_HOST or the local default when None.
+        cache (LLMResultCache): Persistent results, or None to clean everything.
+        checkpoint_every (int): Results buffered before they are committed.
+
+    Returns:
+        list: The cleaned texts.
+    """
+    keys = [LLMResultCache.key(system_prompt, OLLAMA_MODEL, text.strip()) for text in texts]
+    cleaned_by_key = cache.get_many(keys) if cache is not None else {}
+    # One request per distinct text that is not cached yet
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cleaned_by_key:
+            missing.setdefault(key, text)
+    print(f"{len(texts)} turns: {len(texts) - sum(key in missing for key in keys)} cached, "
+          f"{len(missing)} distinct turns to clean")
+
+    client = ollama.AsyncClient(host=host)
+    pending = []
+
+    async def clean(item):
+        return await clean_dialogue_async(client, item[1], system_prompt)
+
+    def checkpoint():
+        if cache is not None and pending:
+            cache.put_many(pending)
+        pending.clear()
+
+    def on_result(index, item, result):
+        key, text = item
+        cleaned_by_key[key] = result
+        pending.append((key, OLLAMA_MODEL, text.strip(), result))
+        if len(pending) >= checkpoint_every:
+            checkpoint()
+
+    try:
+        _, stats = await run_ordered(
+            clean, list(missing.items()), concurrency=concurrency, retries=CLEANING_RETRIES,
+            backoff_s=CLEANING_BACKOFF_S, is_retryable=is_retryable, desc="Cleaning", on_result=on_result,
+        )
+    finally:
+        checkpoint()
+    print(f"Cleaned {stats.completed} turns in {stats.elapsed_s:.1f}s "
+          f"({stats.throughput:.1f} turns/s, {stats.retries} retries)")
+    return [cleaned_by_key[key] for key in keys]
+
+
+def clean_conversations(dataset, concurrency=CLEANING_CONCURRENCY, host=None, cache_path=CLEANING_CACHE):
     """Clean all conversations in the dataset by removing action descriptions and context.
 
     This function processes each conversation in the dataset by removing action descriptions,
     stage directions, and other contextual information from the dialogue, leaving only the
-    spoken lines.
+    spoken lines. The customer and bot turns of all rows are sent to Ollama concurrently,
+    skipping turns already in the cleaning cache.
 
     Args:
         dataset (datasets.Dataset): The input dataset containing conversations in the format:
@@ -131,6 +223,9 @@ def clean_conversations(dataset):
                     {"from": "gpt", "value": str}
                 ]
             }
+        concurrency (int): Largest number of Ollama requests in flight.
+        host (str): Ollama server, OLLAMA_HOST or the local default when None.
+        cache_path (str): SQLite cache of cleaned turns, or None to disable it.
 
     Returns:
         datasets.Dataset: A new dataset with cleaned conversations in the format:
@@ -142,20 +237,24 @@ def clean_conversations(dataset):
                 ]
             }
     """
-    new_rows = []
-
-    for row in tqdm(dataset):
-        rick_completion = clean_dialogue(row["conversations_raw"][1]["value"], CLEANING_PROMPT
-        )
-        non_rick_completion = clean_dialogue(row["conversations_raw"][2]["value"], CLEANING_PROMPT
-        )
+    conversations = dataset["conversations_raw"]
+    # Customer and bot turn of every row, flattened in row order
+    texts = [turn["value"] for conversation in conversations for turn in conversation[1:3]]
+    cache = LLMResultCache(cache_path) if cache_path else None
+    try:
+        cleaned = asyncio.run(clean_texts(texts, CLEANING_PROMPT, concurrency, host, cache))
+    finally:
+        if cache is not None:
+            cache.close()
 
+    new_rows = []
+    for i, conversation in enumerate(conversations):
         new_rows.append(
             {
                 "conversations": [
-                    {"from": "system", "value": row["conversations_raw"][0]["value"]},
-                    {"from": "human", "value": rick_completion},
-                    {"from": "gpt", "value": non_rick_completion},
+                    {"from": "system", "value": conversation[0]["value"]},
+                    {"from": "human", "value": cleaned[2 * i]},
+                    {"from": "gpt", "value": cleaned[2 * i + 1]},
                 ]
             }
         )
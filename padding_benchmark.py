@@ -0,0 +1,136 @@
+import argparse
+import json
+import time
+
+import pandas as pd
+import torch
+from transformers import AutoModelForCausalLM, AutoModelForSequenceClassification, AutoTokenizer
+
+from utils.bucketing import LengthBucketCollator, LengthBucketSampler
+from utils.packing import PackedSequenceCollator, pack_batch
+
+TINYBERT_MODEL = './fine-tuned-tinybert'
+OPT_MODEL = './fine-tuned-opt-125m'
+# Fixed lengths the fine-tuning scripts padded to before length bucketing
+MAX_LENGTHS = {'tinybert': 64, 'opt': 128}
+
+
+def load_texts(model_name):
+    if model_name == 'tinybert':
+        return pd.read_csv('mtn_chatbot_dataset.csv')['User Query'].tolist()
+    with open('mtn_chatbot_dataset.json') as f:
+        examples = json.load(f)
+    # Same text layout as facebook_finetuning.py
+    return [f"{example['instruction']}\n{example['input']}\n{example['output']}" for example in examples]
+
+
+def pad_to_max_length(feature, max_length, pad_token_id):
+    padding = max_length - len(feature['input_ids'])
+    padded = {
+        'input_ids': feature['input_ids'] + [pad_token_id] * padding,
+        'attention_mask': feature['attention_mask'] + [0] * padding,
+    }
+    if 'labels' in feature:
+        padded['labels'] = feature['labels'] + [-100] * padding
+    return padded
+
+
+def collate(collator, features):
+    return collator(features), sum(len(feature['input_ids']) for feature in features)
+
+
+def training_step(model, model_name, batch):
+    if model_name == 'tinybert':
+        labels = torch.zeros(len(batch['input_ids']), dtype=torch.long)
+        loss = model(**batch, labels=labels).loss
+    else:
+        loss = model(**batch).loss
+    loss.backward()
+    model.zero_grad(set_to_none=True)
+
+
+def run(model, model_name, batches, training):
+    """Time `(batch, real token count)` pairs, returning real (non-padding) and padded tokens per second."""
+    real_tokens = padded_tokens = 0
+    start = time.perf_counter()
+    for batch, batch_real_tokens in batches:
+        if training:
+            training_step(model, model_name, batch)
+        else:
+            with torch.no_grad():
+                model(**{key: value for key, value in batch.items() if key != 'labels'})
+        real_tokens += batch_real_tokens
+        padded_tokens += batch['input_ids'].numel()
+    elapsed = time.perf_counter() - start
+    return {
+        'real_tokens_per_s': real_tokens / elapsed,
+        'padded_tokens_per_s': padded_tokens / elapsed,
+        'padding_ratio': 1 - real_tokens / padded_tokens,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tokens/sec with max_length padding vs length-bucketed padding (and packing for OPT)"
+    )
+    parser.add_argument('--model', choices=['tinybert', 'opt'], default='tinybert')
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--examples', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--inference', action='store_true', help="Time forward passes only")
+    args = parser.parse_args()
+
+    model_path = args.model_path or (TINYBERT_MODEL if args.model == 'tinybert' else OPT_MODEL)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model_class = AutoModelForSequenceClassification if args.model == 'tinybert' else AutoModelForCausalLM
+    model = model_class.from_pretrained(model_path)
+    model.train(not args.inference)
+
+    max_length = MAX_LENGTHS[args.model]
+    texts = load_texts(args.model)[:args.examples]
+    features = []
+    for input_ids in tokenizer(texts, truncation=True, max_length=max_length)['input_ids']:
+        feature = {'input_ids': input_ids, 'attention_mask': [1] * len(input_ids)}
+        if args.model == 'opt':
+            feature['labels'] = list(input_ids)
+        features.append(feature)
+
+    collator = LengthBucketCollator(tokenizer)
+    # Before: every example padded to max_length, in dataset order
+    fixed = [pad_to_max_length(feature, max_length, tokenizer.pad_token_id) for feature in features]
+    fixed_batches = [
+        (collator(fixed[start:start + args.batch_size]), sum(len(f['input_ids']) for f in features[start:start + args.batch_size]))
+        for start in range(0, len(fixed), args.batch_size)
+    ]
+    # After: batches drawn from length buckets, padded to their longest member
+    sampler = LengthBucketSampler([len(feature['input_ids']) for feature in features], args.batch_size)
+    bucketed_batches = [collate(collator, [features[index] for index in batch]) for batch in sampler]
+    batches = {f'max_length={max_length}': fixed_batches, 'length buckets': bucketed_batches}
+    if args.model == 'opt':
+        # Packed: examples concatenated into max_length rows with a block-diagonal causal mask
+        packed = pack_batch({'input_ids': [feature['input_ids'] for feature in features]}, max_length)
+        rows = [dict(zip(packed, values)) for values in zip(*packed.values())]
+        packed_collator = PackedSequenceCollator(tokenizer)
+        batches['packed'] = [
+            collate(packed_collator, rows[start:start + args.batch_size]) for start in range(0, len(rows), args.batch_size)
+        ]
+
+    run(model, args.model, bucketed_batches[:2], not args.inference)
+    results = {name: run(model, args.model, mode_batches, not args.inference) for name, mode_batches in batches.items()}
+    mode = 'inference' if args.inference else 'training'
+    print(f"{args.model} {mode}, {len(features)} examples, batch size {args.batch_size}")
+    print(f"{'padding':<16}{'real tok/s':>12}{'padded tok/s':>14}{'padding':>9}{'seconds':>9}")
+    for name, result in results.items():
+        print(f"{name:<16}{result['real_tokens_per_s']:>12.0f}{result['padded_tokens_per_s']:>14.0f}"
+              f"{result['padding_ratio']:>9.1%}{result['seconds']:>9.2f}")
+    before = results[f'max_length={max_length}']
+    for name, result in results.items():
+        if result is not before:
+            print(f"speedup of {name} (real tokens/s): {result['real_tokens_per_s'] / before['real_tokens_per_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
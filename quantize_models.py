@@ -0,0 +1,92 @@
+import argparse
+import os
+
+import pandas as pd
+
+import inference_base_nlp
+import inference_facebook_model
+from utils import quantization
+
+DATASET = 'mtn_chatbot_dataset.csv'
+# Largest drop in intent accuracy (absolute, 0-1) an int8 model may show before it is rejected
+MAX_ACCURACY_DROP = 0.01
+EVAL_SAMPLES = 500
+
+
+def load_eval_set(samples):
+    df = pd.read_csv(DATASET)
+    df = df.sample(n=min(samples, len(df)), random_state=0)
+    return df['User Query'].tolist(), df['Action'].tolist()
+
+
+def tinybert_accuracy(classifier, queries, actions, batch_size=64):
+    correct = 0
+    for start in range(0, len(queries), batch_size):
+        results = classifier(queries[start:start + batch_size])
+        for result, action in zip(results, actions[start:start + batch_size]):
+            correct += inference_base_nlp.map_label_to_action([result])['action'] == action
+    return correct / len(queries)
+
+
+def opt_accuracy(generator, queries, actions, batch_size=16):
+    prompts = [f"Classify the intent and extract parameters from the user query.\n{query}" for query in queries]
+    outputs = generator(prompts, batch_size=batch_size, max_new_tokens=50, do_sample=False)
+    correct = sum(
+        inference_facebook_model.extract_intent(output[0]['generated_text']) == action
+        for output, action in zip(outputs, actions)
+    )
+    return correct / len(queries)
+
+
+def apply_gate(name, model, model_path, fp32_accuracy, int8_accuracy, max_drop):
+    """Save the int8 weights only if accuracy dropped by at most `max_drop`."""
+    drop = fp32_accuracy - int8_accuracy
+    print(f"{name}: fp32 accuracy {fp32_accuracy:.2%}, int8 accuracy {int8_accuracy:.2%}, drop {drop:+.2%}")
+    if drop > max_drop:
+        # A stale variant from an earlier run must not be picked up by the loader either
+        path = quantization.int8_weights_path(model_path)
+        if os.path.exists(path):
+            os.remove(path)
+        print(f"{name}: REJECTED, accuracy drop is above {max_drop:.2%}; serving stays on fp32")
+        return False
+    path = quantization.save_int8(model, model_path)
+    print(f"{name}: saved {path} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+    return True
+
+
+def quantize_tinybert(queries, actions, max_drop):
+    classifier = inference_base_nlp.TinyBertClassifier(inference_base_nlp.TINYBERT_MODEL)
+    fp32_accuracy = tinybert_accuracy(classifier, queries, actions)
+    classifier.model = quantization.quantize_dynamic_int8(classifier.model)
+    int8_accuracy = tinybert_accuracy(classifier, queries, actions)
+    return apply_gate("TinyBERT", classifier.model, inference_base_nlp.TINYBERT_MODEL,
+                      fp32_accuracy, int8_accuracy, max_drop)
+
+
+def quantize_opt(queries, actions, max_drop):
+    generator = inference_facebook_model.load_generator()
+    fp32_accuracy = opt_accuracy(generator, queries, actions)
+    generator.model = quantization.quantize_dynamic_int8(generator.model)
+    int8_accuracy = opt_accuracy(generator, queries, actions)
+    return apply_gate("OPT-125m", generator.model, inference_facebook_model.FINETUNED_MODEL,
+                      fp32_accuracy, int8_accuracy, max_drop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write int8 variants of the fine-tuned models behind an accuracy gate")
+    parser.add_argument('--models', nargs='+', choices=['tinybert', 'opt'], default=['tinybert', 'opt'])
+    parser.add_argument('--max-accuracy-drop', type=float, default=MAX_ACCURACY_DROP)
+    parser.add_argument('--eval-samples', type=int, default=EVAL_SAMPLES)
+    args = parser.parse_args()
+
+    # Always start from the fp32 weights, even if an int8 variant already exists
+    quantization.USE_INT8_WEIGHTS = False
+    queries, actions = load_eval_set(args.eval_samples)
+    if 'tinybert' in args.models:
+        quantize_tinybert(queries, actions, args.max_accuracy_drop)
+    if 'opt' in args.models:
+        quantize_opt(queries, actions, args.max_accuracy_drop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import time
+
+from inference_momo_assistant import (
+    ENCODER_MODEL,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_THRESHOLD,
+    TinyBertEncoder,
+    generate_answer,
+    question_numbers,
+)
+from utils.columnar import load_table
+from utils.semantic_cache import SemanticCache
+
+# Replays the customer questions of dataset/mtn-mobile-money-conversations-*.csv through the
+# semantic cache in front of the assistant, e.g. against the stub server:
+#   python stub_ollama_server.py --port 11435 --latency-ms 1500 &
+#   OLLAMA_HOST=http://127.0.0.1:11435 python semantic_cache_benchmark.py --threshold 0.9
+# The hits listed at the end are there to calibrate the threshold of an encoder.
+
+
+def customer_questions():
+    # Standalone questions only: replies like "Yes, please." depend on the conversation
+    table = load_table("momo_dialogues").to_pandas()
+    questions = table[(table["speaker"] == "Customer") & table["dialogue"].str.strip().str.endswith("?")]
+    return questions["dialogue"].str.strip().tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hit rate and latency of the MoMo assistant semantic cache")
+    parser.add_argument('--encoder', default=ENCODER_MODEL)
+    parser.add_argument('--threshold', type=float, default=SEMANTIC_CACHE_THRESHOLD)
+    parser.add_argument('--maxsize', type=int, default=SEMANTIC_CACHE_SIZE)
+    parser.add_argument('--show', type=int, default=15, help="Hits to print, least similar first")
+    args = parser.parse_args()
+
+    encoder = TinyBertEncoder(args.encoder)
+    cache = SemanticCache(encoder, encoder.dim, args.threshold, args.maxsize, guard=question_numbers)
+    questions = customer_questions()
+    hits, latencies = [], {True: [], False: []}
+    for question in questions:
+        start = time.perf_counter()
+        _, match = cache.get_or_compute(question, generate_answer)
+        if match is not None:
+            hits.append((match[0], question, match[1]))
+        latencies[match is not None].append(time.perf_counter() - start)
+
+    stats = cache.stats()
+    print(f"{len(questions)} questions, threshold {args.threshold}: {stats['hits']} hits "
+          f"({stats['hit_rate']:.1%}), {stats['guard_rejections']} rejected for different numbers")
+    for cached, name in ((False, "generated"), (True, "cached")):
+        if latencies[cached]:
+            print(f"  {name}: {len(latencies[cached])} answers, "
+                  f"mean {sum(latencies[cached]) / len(latencies[cached]) * 1000:.1f} ms")
+    total = sum(latencies[False]) + sum(latencies[True])
+    without_cache = sum(latencies[False]) / max(len(latencies[False]), 1) * len(questions)
+    print(f"  total {total:.1f}s against about {without_cache:.1f}s without the cache")
+    for similarity, question, cached_question in sorted(hits)[:args.show]:
+        print(f"  {similarity:.3f}  {question!r} -> {cached_question!r}")
+
+
+if __name__ == "__main__":
+    main()
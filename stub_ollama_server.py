@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import random
+import re
+import time
+
+from aiohttp import web
+
+# Stand-in for the Ollama chat API, to run and test the cleaning pipeline without a model:
+#   python stub_ollama_server.py --port 11435 --latency-ms 200 --failure-rate 0.1
+#   OLLAMA_HOST=http://127.0.0.1:11435 python momo_conversational_dataset.py
+# It answers /api/chat with the last user message minus a leading system action
+# ("verifies customer identity. ..."), after a simulated latency, and fails a share
+# of the requests with 503 (or --failure-status) to exercise retries.
+
+# A lowercase clause ending in a period at the start of the text, e.g. "processes payment request. "
+ACTION_PATTERN = re.compile(r"^[a-z][a-z ,'-]*\.\s+")
+
+
+def strip_action(text):
+    return ACTION_PATTERN.sub("", text.strip(), count=1)
+
+
+class StubStats:
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+def create_app(latency_ms=50.0, jitter_ms=0.0, failure_rate=0.0, seed=0, failure_status=503):
+    """aiohttp app serving the stub `/api/chat` and its counters on `/stats`.
+
+    A `failure_rate` share of the requests is answered with `failure_status`,
+    e.g. 400 to check that client errors are not retried.
+    """
+    rng = random.Random(seed)
+    stats = StubStats()
+
+    async def chat(request):
+        body = await request.json()
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            await asyncio.sleep((latency_ms + rng.uniform(0, jitter_ms)) / 1000)
+            if rng.random() < failure_rate:
+                stats.failures += 1
+                return web.json_response({"error": "stub server failure"}, status=failure_status)
+        finally:
+            stats.in_flight -= 1
+        user_messages = [message["content"] for message in body.get("messages", []) if message["role"] == "user"]
+        return web.json_response({
+            "model": body.get("model", "stub"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": strip_action(user_messages[-1] if user_messages else "")},
+            "done": True,
+            "done_reason": "stop",
+        })
+
+    async def stub_stats(request):
+        return web.json_response(stats.as_dict())
+
+    app = web.Application()
+    app["stats"] = stats
+    app.router.add_post('/api/chat', chat)
+    app.router.add_get('/stats', stub_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama chat server for the cleaning pipeline")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--latency-ms', type=float, default=50.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--failure-status', type=int, default=503)
+    args = parser.parse_args()
+    app = create_app(args.latency_ms, args.jitter_ms, args.failure_rate, args.seed, args.failure_status)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import asyncio
+
+import ollama
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import momo_conversational_dataset
+from momo_conversational_dataset import CLEANING_PROMPT, clean_texts
+from stub_ollama_server import create_app
+
+TEXTS = [f"processes payment request. Turn {i} sent UGX {i},000." for i in range(24)]
+EXPECTED = [f"Turn {i} sent UGX {i},000." for i in range(24)]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(momo_conversational_dataset, "CLEANING_BACKOFF_S", 0.001)
+
+
+def run_against_stub(texts, concurrency=4, **stub_options):
+    """Clean `texts` against a stub server and return `(cleaned texts or error, stub /stats)`."""
+
+    async def run():
+        async with TestClient(TestServer(create_app(**stub_options))) as client:
+            host = str(client.server.make_url("")).rstrip("/")
+            try:
+                result = await clean_texts(texts, CLEANING_PROMPT, concurrency=concurrency, host=host)
+            except ollama.ResponseError as error:
+                result = error
+            stats = await (await client.get("/stats")).json()
+            return result, stats
+
+    return asyncio.run(run())
+
+
+def test_output_order_is_preserved():
+    # Jitter makes the responses arrive out of order
+    cleaned, stats = run_against_stub(TEXTS, latency_ms=5, jitter_ms=30)
+    assert cleaned == EXPECTED
+    assert stats["requests"] == len(TEXTS)
+
+
+def test_server_errors_are_retried_until_they_succeed(monkeypatch):
+    monkeypatch.setattr(momo_conversational_dataset, "CLEANING_RETRIES", 30)
+    cleaned, stats = run_against_stub(TEXTS, latency_ms=1, failure_rate=0.5, seed=1)
+    assert cleaned == EXPECTED
+    assert stats["failures"] > 0
+    assert stats["requests"] == len(TEXTS) + stats["failures"]
+
+
+def test_client_errors_are_not_retried():
+    error, stats = run_against_stub(TEXTS[:1], latency_ms=1, failure_rate=1.0, failure_status=400)
+    assert isinstance(error, ollama.ResponseError) and error.status_code == 400
+    assert stats["requests"] == 1
+
+
+def test_requests_in_flight_stay_under_the_concurrency_cap():
+    _, stats = run_against_stub(TEXTS, concurrency=3, latency_ms=10, jitter_ms=10)
+    assert 1 <= stats["max_in_flight"] <= 3
@@ -0,0 +1,50 @@
+import json
+
+import torch
+
+from utils.constrained_decoding import ConstrainedDecoder, IntentJsonGrammar
+
+WHITESPACE_TOKENS = ["\n", " ", "\n\n", "  ", " \n"]
+
+
+class CharTokenizer:
+    """One token per printable character, plus whitespace runs."""
+
+    def __init__(self):
+        self.vocab = WHITESPACE_TOKENS + [chr(code) for code in range(33, 127)]
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def decode(self, token_ids, clean_up_tokenization_spaces=False):
+        return "".join(self.vocab[token_id] for token_id in token_ids)
+
+
+def decode_greedy(decoder, logits):
+    text = ""
+    for _ in range(decoder.max_tokens):
+        token_id = decoder.next_token(logits, text)
+        if token_id is None:
+            break
+        text += decoder.token_texts[token_id]
+        if decoder.is_complete(text):
+            break
+    return text
+
+
+def test_whitespace_preferring_model_still_produces_json():
+    decoder = ConstrainedDecoder(CharTokenizer())
+    # Whitespace scores highest, the remaining tokens in a fixed arbitrary order
+    logits = torch.randn(len(decoder.token_texts), generator=torch.Generator().manual_seed(0))
+    logits[:len(WHITESPACE_TOKENS)] = 100.0
+    text = decode_greedy(decoder, logits)
+    assert decoder.is_complete(text)
+    assert "intent" in json.loads(text)
+
+
+def test_object_opens_without_leading_whitespace():
+    grammar = IntentJsonGrammar()
+    assert grammar.is_prefix('{"intent": ')
+    assert not grammar.is_prefix("\n")
+    assert not grammar.is_prefix(" {")
+    assert grammar.is_complete('{"intent": "Check balance"}')
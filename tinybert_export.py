@@ -0,0 +1,131 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+import torch
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+from inference_base_nlp import (
+    BACKENDS,
+    MAX_QUERY_TOKENS,
+    ONNX_FILE,
+    TINYBERT_MODEL,
+    TORCHSCRIPT_FILE,
+)
+from utils import quantization
+
+DATASET = 'mtn_chatbot_dataset.csv'
+# Largest absolute logit difference accepted between the eager model and an exported graph
+ATOL = 1e-4
+INPUT_NAMES = ['input_ids', 'attention_mask', 'token_type_ids']
+
+
+def example_inputs(tokenizer, queries):
+    encoded = tokenizer(queries, padding=True, truncation=True, max_length=MAX_QUERY_TOKENS, return_tensors='pt')
+    return tuple(encoded[name] for name in INPUT_NAMES)
+
+
+def export_torchscript(model_path=TINYBERT_MODEL, example_queries=("Check my balance", "Send 50 ZAR to John")):
+    """Trace and freeze the classifier into `<model_path>/model.torchscript.pt`."""
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path, torchscript=True)
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_inputs(tokenizer, list(example_queries)))
+        traced = torch.jit.freeze(traced)
+    output_path = os.path.join(model_path, TORCHSCRIPT_FILE)
+    traced.save(output_path)
+    return output_path
+
+
+def export_onnx(model_path=TINYBERT_MODEL, example_queries=("Check my balance", "Send 50 ZAR to John"), opset=17):
+    """Export the classifier to `<model_path>/model.onnx` with dynamic batch and sequence axes."""
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForSequenceClassification.from_pretrained(model_path)
+    model.eval()
+    output_path = os.path.join(model_path, ONNX_FILE)
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in INPUT_NAMES}
+    dynamic_axes['logits'] = {0: 'batch'}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            example_inputs(tokenizer, list(example_queries)),
+            output_path,
+            input_names=INPUT_NAMES,
+            output_names=['logits'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            dynamo=False,
+        )
+    return output_path
+
+
+def check_outputs(classifier, reference, queries, atol=ATOL, batch_size=32):
+    """Compare logits of an exported backend against the eager model.
+
+    Returns:
+        dict: Largest absolute logit difference and the share of queries
+            whose predicted label is the same in both.
+    """
+    max_diff = 0.0
+    same_label = 0
+    for start in range(0, len(queries), batch_size):
+        encoded = reference.encode(queries[start:start + batch_size])
+        expected = reference.logits(encoded)
+        actual = classifier.logits(encoded)
+        max_diff = max(max_diff, (expected - actual).abs().max().item())
+        same_label += (expected.argmax(dim=-1) == actual.argmax(dim=-1)).sum().item()
+    return {
+        "max_abs_diff": max_diff,
+        "label_agreement": same_label / len(queries),
+        "passed": max_diff <= atol,
+    }
+
+
+def benchmark(classifier, queries, batch_size, runs=50):
+    """Mean milliseconds per `classifier(batch)` call, after one warm-up call."""
+    batch = (queries * batch_size)[:batch_size]
+    classifier(batch)
+    start = time.perf_counter()
+    for _ in range(runs):
+        classifier(batch)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export fine-tuned-tinybert to an optimized CPU graph")
+    parser.add_argument('--format', choices=['torchscript', 'onnx', 'all'], default='all')
+    parser.add_argument('--model', default=TINYBERT_MODEL)
+    parser.add_argument('--check-queries', type=int, default=500, help="Dataset queries used for the numerical check")
+    parser.add_argument('--runs', type=int, default=50, help="Timed calls per backend and batch size")
+    args = parser.parse_args()
+
+    formats = ['torchscript', 'onnx'] if args.format == 'all' else [args.format]
+    exporters = {'torchscript': export_torchscript, 'onnx': export_onnx}
+    for backend in formats:
+        print(f"Exported {backend}: {exporters[backend](args.model)}")
+
+    # The graphs are exported from the fp32 weights, so compare against those
+    quantization.USE_INT8_WEIGHTS = False
+    queries = pd.read_csv(DATASET)['User Query'].tolist()[:args.check_queries]
+    reference = BACKENDS['eager'](args.model)
+    classifiers = {'eager': reference}
+    for backend in formats:
+        classifiers[backend] = BACKENDS[backend](args.model)
+        check = check_outputs(classifiers[backend], reference, queries)
+        print(f"{backend}: max |logit diff| {check['max_abs_diff']:.2e}, "
+              f"label agreement {check['label_agreement']:.2%}, {'OK' if check['passed'] else 'FAILED'}")
+        if not check['passed']:
+            raise SystemExit(f"{backend} export differs from the eager model by more than {ATOL}")
+
+    print(f"{'backend':<12}{'batch':>6}{'ms/call':>10}{'speedup':>9}")
+    for batch_size in (1, 32):
+        eager_ms = benchmark(reference, queries, batch_size, args.runs)
+        for backend, classifier in classifiers.items():
+            ms = eager_ms if backend == 'eager' else benchmark(classifier, queries, batch_size, args.runs)
+            print(f"{backend:<12}{batch_size:>6}{ms:>10.2f}{eager_ms / ms:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
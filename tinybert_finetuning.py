@@ -1,13 +1,19 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, Trainer, TrainingArguments
-from datasets import load_dataset
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, TrainingArguments
 import numpy as np
 
-# Load your dataset
-dataset = load_dataset('csv', data_files='mtn_chatbot_dataset.csv')
+from utils.bucketed_trainer import BucketedTrainer
+from utils.bucketing import LengthBucketCollator
+from utils.columnar import dataset_path, read_table
+from utils.tokenized_cache import load_tokenized
 
-# Create a mapping from action names to numeric labels
+# Typed Arrow copy of mtn_chatbot_dataset.csv, converted on first use
+DATASET = dataset_path('intents')
+MAX_LENGTH = 64
+
+# Create a mapping from action names to numeric labels, sorted so that it is
+# the same on every run and matches the labels in the tokenized cache
 action_to_label = {}
-unique_actions = set(dataset['train']['Action'])
+unique_actions = sorted(read_table(DATASET).column('Action').unique().to_pylist())
 for i, action in enumerate(unique_actions):
     action_to_label[action] = i
 
@@ -23,20 +29,20 @@ def tokenize_function(examples):
     # Convert text actions to numeric labels
     labels = [action_to_label[action] for action in examples['Action']]
     
-    # Tokenize with padding and truncation to a fixed length
-    result = tokenizer(examples['User Query'], padding="max_length", truncation=True, max_length=64)
+    # Truncate only, each batch is padded to its longest query by the collator
+    result = tokenizer(examples['User Query'], truncation=True, max_length=MAX_LENGTH)
     
     # Add labels to the result
     result['labels'] = labels
     
     return result
 
-# Apply tokenization to the dataset
-tokenized_datasets = dataset.map(tokenize_function, batched=True)
+# Apply tokenization to the dataset, or memory-map it from a previous run
+tokenized_dataset = load_tokenized(DATASET, tokenize_function, tokenizer, MAX_LENGTH, extra=action_to_label)
 
 # Prepare the dataset for training
-train_dataset = tokenized_datasets['train'].shuffle(seed=42).select(range(min(1000, len(tokenized_datasets['train']))))
-eval_dataset = tokenized_datasets['train'].shuffle(seed=42).select(range(min(200, len(tokenized_datasets['train']))))
+train_dataset = tokenized_dataset.shuffle(seed=42).select(range(min(1000, len(tokenized_dataset))))
+eval_dataset = tokenized_dataset.shuffle(seed=42).select(range(min(200, len(tokenized_dataset))))
 
 # Load the TinyBERT model with the correct number of labels
 num_labels = len(action_to_label)
@@ -56,12 +62,13 @@ training_args = TrainingArguments(
     weight_decay=0.01,
 )
 
-# Define the Trainer
-trainer = Trainer(
+# Define the Trainer, batches are drawn from length buckets
+trainer = BucketedTrainer(
     model=model,
     args=training_args,
     train_dataset=train_dataset,
     eval_dataset=eval_dataset,
+    data_collator=LengthBucketCollator(tokenizer),
 )
 
 # Fine-tune the model
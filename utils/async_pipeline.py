@@ -0,0 +1,112 @@
+import asyncio
+import random
+import time
+
+from tqdm import tqdm
+
+
+class PipelineStats:
+    """Counters of one `run_ordered` call."""
+
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.retries = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    @property
+    def elapsed_s(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def throughput(self):
+        return self.completed / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "retries": self.retries,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "items_per_s": round(self.throughput, 2),
+        }
+
+
+def backoff_delay(attempt, base_s, max_s):
+    # Exponential backoff with jitter, so retries of concurrent calls do not arrive together
+    return min(max_s, base_s * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+async def call_with_retries(fn, item, retries=3, backoff_s=0.5, max_backoff_s=30.0, is_retryable=None, stats=None):
+    """Await `fn(item)`, retrying failed calls up to `retries` times with exponential backoff.
+
+    Errors for which `is_retryable(error)` is false are raised at once.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await fn(item)
+        except Exception as error:
+            if attempt >= retries or (is_retryable is not None and not is_retryable(error)):
+                raise
+            await asyncio.sleep(backoff_delay(attempt, backoff_s, max_backoff_s))
+            attempt += 1
+            if stats is not None:
+                stats.retries += 1
+
+
+async def run_ordered(fn, items, concurrency=8, retries=3, backoff_s=0.5, max_backoff_s=30.0,
+                      is_retryable=None, desc=None, on_result=None):
+    """Await `fn(item)` for every item with at most `concurrency` calls in flight.
+
+    Calls finish in any order but results are returned in the order of
+    `items`. Each call is retried as in `call_with_retries`; if one still
+    fails, the remaining calls are cancelled and the error is raised.
+    Progress and throughput are shown with tqdm.
+
+    Args:
+        fn (callable): Coroutine function taking one item.
+        items (list): Inputs, in the order results are wanted.
+        concurrency (int): Largest number of calls awaited at once.
+        retries (int): Retries of a failed call before giving up.
+        backoff_s (float): Delay before the first retry, doubled for each next one.
+        max_backoff_s (float): Upper bound of the delay between retries.
+        is_retryable (callable): Tells whether an error is worth retrying,
+            all errors are by default.
+        desc (str): Label of the progress bar.
+        on_result (callable): Called with `(index, item, result)` as soon as
+            each call succeeds, e.g. to checkpoint results.
+
+    Returns:
+        tuple: The list of results and the `PipelineStats` of the run.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    stats = PipelineStats(len(items))
+    pending = iter(enumerate(items))
+    progress = tqdm(total=len(items), desc=desc, unit="item")
+
+    async def worker():
+        # Workers share one iterator, so at most `concurrency` items are in flight
+        for index, item in pending:
+            results[index] = await call_with_retries(
+                fn, item, retries, backoff_s, max_backoff_s, is_retryable, stats
+            )
+            if on_result is not None:
+                on_result(index, item, results[index])
+            stats.completed += 1
+            progress.update(1)
+            progress.set_postfix(retries=stats.retries, refresh=False)
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, min(concurrency, len(items))))]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        raise
+    finally:
+        stats.finished_at = time.perf_counter()
+        progress.close()
+    return results, stats
@@ -0,0 +1,142 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+
+class BatchMetrics:
+    """Running counters describing the batches a MicroBatcher has executed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.failed_batches = 0
+        self.batch_sizes = Counter()
+        self.total_wait_ms = 0.0
+        self.total_compute_ms = 0.0
+        self.last_batch = None
+
+    def record(self, size, wait_ms, compute_ms, failed=False):
+        """Record one batch. `wait_ms` is the queue wait summed over its items."""
+        with self._lock:
+            self.batches += 1
+            self.requests += size
+            self.failed_batches += int(failed)
+            self.batch_sizes[size] += 1
+            self.total_wait_ms += wait_ms
+            self.total_compute_ms += compute_ms
+            self.last_batch = {
+                "size": size,
+                "mean_queue_wait_ms": round(wait_ms / max(size, 1), 3),
+                "compute_ms": round(compute_ms, 3),
+                "failed": failed,
+            }
+
+    def as_dict(self):
+        with self._lock:
+            batches = max(self.batches, 1)
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "failed_batches": self.failed_batches,
+                "mean_batch_size": round(self.requests / batches, 3),
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "mean_queue_wait_ms": round(self.total_wait_ms / max(self.requests, 1), 3),
+                "mean_compute_ms": round(self.total_compute_ms / batches, 3),
+                "last_batch": self.last_batch,
+            }
+
+
+class MicroBatcher:
+    """Groups concurrent requests into batches for a single forward pass.
+
+    Callers `submit` one item and get a Future back. A background worker
+    collects items until either `max_batch_size` items are pending or
+    `max_wait_ms` has passed since the first one arrived, calls
+    `process_batch(items)` once, and resolves each Future with its result.
+
+    Args:
+        process_batch (callable): Takes a list of items and returns a list of
+            results in the same order.
+        max_batch_size (int): Largest number of items run in one batch.
+        max_wait_ms (float): How long the first item of a batch may wait for
+            others to join it.
+        name (str): Used to name the worker thread.
+    """
+
+    def __init__(self, process_batch, max_batch_size=16, max_wait_ms=5.0, name="batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self.metrics = BatchMetrics()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def stats(self):
+        stats = self.metrics.as_dict()
+        stats.update(
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=self.max_wait_ms,
+            pending=self._queue.qsize(),
+        )
+        return stats
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Window closed, but still take anything that is already queued
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            start = time.perf_counter()
+            wait_ms = sum(start - enqueued for _, _, enqueued in batch) * 1000
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: process_batch returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as error:
+                self.metrics.record(len(items), wait_ms, (time.perf_counter() - start) * 1000, failed=True)
+                for future in futures:
+                    future.set_exception(error)
+                continue
+            self.metrics.record(len(items), wait_ms, (time.perf_counter() - start) * 1000)
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,61 @@
+import time
+
+from torch.utils.data import DataLoader
+from transformers import Trainer
+
+from utils.bucketing import BUCKET_BOUNDARIES, LengthBucketSampler
+
+
+class BucketedTrainer(Trainer):
+    """Trainer drawing every batch from a single length bucket.
+
+    The datasets must be tokenized without padding and the data collator
+    must pad per batch, e.g. `utils.bucketing.LengthBucketCollator`. When the
+    collator counts tokens, logs also carry `train_tokens_per_second` (real,
+    non-padding tokens) and `padding_ratio`.
+
+    Args:
+        boundaries (tuple): Bucket upper bounds, see `utils.bucketing`.
+    """
+
+    def __init__(self, *args, boundaries=BUCKET_BOUNDARIES, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.boundaries = boundaries
+        self._train_start = None
+
+    def _bucketed_dataloader(self, dataset, batch_size, shuffle, description):
+        dataset = self._remove_unused_columns(dataset, description=description)
+        lengths = [len(input_ids) for input_ids in dataset["input_ids"]]
+        sampler = LengthBucketSampler(
+            lengths, batch_size, self.boundaries, shuffle=shuffle, seed=self.args.seed,
+            drop_last=self.args.dataloader_drop_last,
+        )
+        dataloader = DataLoader(
+            dataset,
+            batch_sampler=sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        )
+        return self.accelerator.prepare(dataloader)
+
+    def get_train_dataloader(self):
+        return self._bucketed_dataloader(self.train_dataset, self._train_batch_size, True, "training")
+
+    def get_eval_dataloader(self, eval_dataset=None):
+        eval_dataset = eval_dataset if eval_dataset is not None else self.eval_dataset
+        return self._bucketed_dataloader(eval_dataset, self.args.eval_batch_size, False, "evaluation")
+
+    def train(self, *args, **kwargs):
+        if hasattr(self.data_collator, "reset_stats"):
+            self.data_collator.reset_stats()
+        self._train_start = time.perf_counter()
+        return super().train(*args, **kwargs)
+
+    def log(self, logs, *args, **kwargs):
+        if self._train_start is not None and hasattr(self.data_collator, "stats"):
+            stats = self.data_collator.stats()
+            elapsed = time.perf_counter() - self._train_start
+            logs["train_tokens_per_second"] = round(stats["real_tokens"] / elapsed, 1)
+            logs["padding_ratio"] = stats["padding_ratio"]
+        super().log(logs, *args, **kwargs)
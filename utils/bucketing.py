@@ -0,0 +1,125 @@
+import random
+import threading
+from collections import defaultdict
+
+import torch
+
+# Upper bounds of the length buckets, most MoMo queries fall in the first one
+BUCKET_BOUNDARIES = (16, 32, 64, 128, 256, 512)
+LABEL_PAD_TOKEN_ID = -100
+
+
+def bucket_length(length, boundaries=BUCKET_BOUNDARIES):
+    """Smallest bucket boundary that fits `length`, or `length` itself past the last one."""
+    for boundary in boundaries:
+        if length <= boundary:
+            return boundary
+    return length
+
+
+class LengthBucketSampler:
+    """Batch sampler grouping examples of similar token length.
+
+    Examples are assigned to the bucket of `bucket_length` and every batch is
+    drawn from a single bucket, so padding a batch to its longest member
+    wastes at most the width of one bucket. With `shuffle`, examples within a
+    bucket and the order of batches are shuffled anew each epoch, from `seed`.
+
+    Args:
+        lengths (list): Token count of every example in the dataset.
+        batch_size (int): Examples per batch.
+        boundaries (tuple): Bucket upper bounds, in increasing order.
+        shuffle (bool): Shuffle examples and batches, for training.
+        seed (int): Base seed of the shuffling, offset by the epoch.
+        drop_last (bool): Drop the incomplete last batch of every bucket.
+    """
+
+    def __init__(self, lengths, batch_size, boundaries=BUCKET_BOUNDARIES, shuffle=True, seed=0, drop_last=False):
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        buckets = defaultdict(list)
+        for index, length in enumerate(lengths):
+            buckets[bucket_length(length, boundaries)].append(index)
+        self.buckets = [buckets[key] for key in sorted(buckets)]
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        rng = random.Random(self.seed + self.epoch)
+        # A new order every time the dataloader is iterated, i.e. every epoch
+        self.epoch += 1
+        batches = []
+        for indices in self.buckets:
+            if self.shuffle:
+                indices = rng.sample(indices, len(indices))
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start:start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        if self.shuffle:
+            rng.shuffle(batches)
+        return iter(batches)
+
+    def __len__(self):
+        if self.drop_last:
+            return sum(len(indices) // self.batch_size for indices in self.buckets)
+        return sum(-(-len(indices) // self.batch_size) for indices in self.buckets)
+
+
+class LengthBucketCollator:
+    """Pads a batch of tokenized examples to its longest member only.
+
+    Sequence features (`input_ids`, `attention_mask`, `token_type_ids`,
+    token-level `labels`) are padded on the tokenizer's padding side, with
+    the pad token, 0 or `label_pad_token_id` respectively. Scalar features
+    such as class labels are stacked as they are. The collator counts real
+    and padded tokens so trainers can report throughput.
+
+    Args:
+        tokenizer: Tokenizer the examples were encoded with.
+        label_pad_token_id (int): Label of padding positions, ignored by the loss.
+    """
+
+    def __init__(self, tokenizer, label_pad_token_id=LABEL_PAD_TOKEN_ID):
+        self.pad_token_id = tokenizer.pad_token_id
+        self.padding_side = tokenizer.padding_side
+        self.label_pad_token_id = label_pad_token_id
+        self._lock = threading.Lock()
+        self.real_tokens = 0
+        self.padded_tokens = 0
+
+    def _pad(self, values, length, pad_value):
+        padding = [pad_value] * (length - len(values))
+        return padding + values if self.padding_side == "left" else values + padding
+
+    def __call__(self, features):
+        length = max(len(feature["input_ids"]) for feature in features)
+        pad_values = {"input_ids": self.pad_token_id, "labels": self.label_pad_token_id}
+        batch = {}
+        for key in features[0]:
+            values = [feature[key] for feature in features]
+            if isinstance(values[0], (list, tuple)):
+                pad_value = pad_values.get(key, 0)
+                values = [self._pad(list(value), length, pad_value) for value in values]
+            batch[key] = torch.tensor(values)
+        with self._lock:
+            self.real_tokens += sum(len(feature["input_ids"]) for feature in features)
+            self.padded_tokens += length * len(features)
+        return batch
+
+    def reset_stats(self):
+        with self._lock:
+            self.real_tokens = 0
+            self.padded_tokens = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "real_tokens": self.real_tokens,
+                "padded_tokens": self.padded_tokens,
+                "padding_ratio": round(1 - self.real_tokens / self.padded_tokens, 4) if self.padded_tokens else 0.0,
+            }
@@ -0,0 +1,196 @@
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from datasets import Dataset
+
+from utils.synthetic_intents import SCHEMAS
+
+# Converted datasets are stored as <COLUMNAR_DATASET_DIR>/<name>.arrow, uncompressed
+# Arrow IPC streams that are memory-mapped on load (and readable by datasets.Dataset.from_file)
+COLUMNAR_DATASET_DIR = os.getenv("COLUMNAR_DATASET_DIR", "./columnar_datasets")
+# Schema metadata key holding the hashes of the text sources a file was converted from
+SOURCES_KEY = b"mtn_chatbot.sources"
+
+TURN_TYPE = pa.struct([("from", pa.string()), ("value", pa.string())])
+CONVERSATION_SCHEMA = pa.schema([("conversations", pa.list_(TURN_TYPE))])
+DIALOGUE_SCHEMA = pa.schema([
+    ("row_index", pa.int64()),
+    ("conversation_id", pa.string()),
+    ("scenario_type", pa.string()),
+    ("speaker", pa.string()),
+    ("dialogue", pa.string()),
+])
+
+# One turn of the NumPy repr of a conversation, {'from': 'human', 'value': '...'},
+# the value being a Python string literal in single or double quotes
+_TURN_PATTERN = re.compile(
+    r"\{'from': '(?P<role>\w+)', 'value': "
+    r"(?:'(?P<single>(?:[^'\\]|\\.)*)'|\"(?P<double>(?:[^\"\\]|\\.)*)\")\}",
+    re.DOTALL,
+)
+_ESCAPE_PATTERN = re.compile(r"\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)", re.DOTALL)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\", "'": "'", '"': '"'}
+
+
+def _unescape(match):
+    code = match.group(1)
+    if len(code) > 1:
+        return chr(int(code[1:], 16))
+    return _ESCAPES.get(code, "\\" + code)
+
+
+def parse_turns(record):
+    """Parse the repr of a list of `{'from': ..., 'value': ...}` turns without evaluating it.
+
+    Raises:
+        ValueError: If the record holds anything other than such turns.
+    """
+    turns = []
+    for match in _TURN_PATTERN.finditer(record):
+        value = match.group("single") if match.group("single") is not None else match.group("double")
+        turns.append({"from": match.group("role"), "value": _ESCAPE_PATTERN.sub(_unescape, value)})
+    if not turns or _TURN_PATTERN.sub("", record).strip("[] \n,"):
+        raise ValueError(f"Not a list of conversation turns: {record[:80]!r}")
+    return turns
+
+
+def read_intent_csv(paths):
+    # Amounts are written as floats ("1782.0") next to empty cells, cast to int64 once here
+    options = pa_csv.ConvertOptions(column_types={"Amount": pa.float64()}, strings_can_be_null=True)
+    table = pa_csv.read_csv(paths[0], convert_options=options)
+    return table.set_column(
+        table.schema.get_field_index("Amount"), "Amount", pc.cast(table.column("Amount"), pa.int64())
+    ).cast(SCHEMAS["csv"])
+
+
+def read_instruction_json(paths):
+    with open(paths[0]) as f:
+        return pa.Table.from_pylist(json.load(f), SCHEMAS["instruction"])
+
+
+def read_sharegpt_csv(paths):
+    with open(paths[0], newline="") as f:
+        text = f.read()
+    # The file has no header and lacks the opening quote of its first record
+    if not text.startswith('"'):
+        text = '"' + text
+    conversations = [parse_turns(row[0]) for row in csv.reader(io.StringIO(text)) if row]
+    return pa.Table.from_pydict({"conversations": conversations}, CONVERSATION_SCHEMA)
+
+
+def read_dialogue_csvs(paths):
+    # Parsed with pandas like datasets.load_dataset("csv") does, which fills the cells of short rows with nulls
+    frames = [pd.read_csv(path, dtype={"conversation_id": str}) for path in paths]
+    return pa.Table.from_pandas(pd.concat(frames, ignore_index=True), DIALOGUE_SCHEMA, preserve_index=False)
+
+
+# name -> (text source file or glob, reader of the matching paths into a typed table)
+DATASETS = {
+    "intents": ("mtn_chatbot_dataset.csv", read_intent_csv),
+    "instructions": ("mtn_chatbot_dataset.json", read_instruction_json),
+    "sharegpt_momo": ("sharegpt_momo_dataset.csv", read_sharegpt_csv),
+    "momo_dialogues": ("dataset/mtn-mobile-money-conversations-*.csv", read_dialogue_csvs),
+}
+
+
+def source_paths(name):
+    # Sorted like the data_files globs of datasets.load_dataset
+    paths = sorted(glob.glob(DATASETS[name][0]))
+    if not paths:
+        raise FileNotFoundError(f"No source file matches {DATASETS[name][0]} for dataset {name}")
+    return paths
+
+
+def sources_fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def write_table(table, path):
+    """Write a table as an uncompressed Arrow IPC stream, or as Parquet for a `.parquet` path."""
+    partial = f"{path}.partial-{os.getpid()}"
+    if path.endswith(".parquet"):
+        pq.write_table(table, partial)
+    else:
+        with ipc.new_stream(partial, table.schema) as writer:
+            writer.write_table(table)
+    # Renamed into place, so readers never see a half-written file
+    os.replace(partial, path)
+
+
+def convert(name, directory=COLUMNAR_DATASET_DIR, parquet=False):
+    """Parse the text source of dataset `name` once and store it as a typed Arrow file.
+
+    Args:
+        name (str): Key of DATASETS.
+        directory (str): Output directory, created if missing.
+        parquet (bool): Also write a compressed `<name>.parquet` copy.
+
+    Returns:
+        str: Path of the Arrow file.
+    """
+    paths = source_paths(name)
+    table = DATASETS[name][1](paths)
+    table = table.replace_schema_metadata({SOURCES_KEY: sources_fingerprint(paths)})
+    os.makedirs(directory, exist_ok=True)
+    path = arrow_path(name, directory)
+    write_table(table, path)
+    if parquet:
+        write_table(table, os.path.join(directory, f"{name}.parquet"))
+    return path
+
+
+def arrow_path(name, directory=COLUMNAR_DATASET_DIR):
+    return os.path.join(directory, f"{name}.arrow")
+
+
+def is_stale(name, directory=COLUMNAR_DATASET_DIR):
+    """Whether the Arrow file of `name` is missing or was converted from other source bytes."""
+    path = arrow_path(name, directory)
+    if not os.path.exists(path):
+        return True
+    with pa.memory_map(path) as source:
+        metadata = ipc.open_stream(source).schema.metadata or {}
+    return metadata.get(SOURCES_KEY, b"").decode() != sources_fingerprint(source_paths(name))
+
+
+def dataset_path(name, directory=COLUMNAR_DATASET_DIR):
+    """Path of the up-to-date Arrow file of `name`, converting its text source first if needed."""
+    if is_stale(name, directory):
+        return convert(name, directory)
+    return arrow_path(name, directory)
+
+
+def read_table(path):
+    """Memory-map an Arrow file: the columns point into the mapped file, nothing is parsed or copied.
+
+    Parquet files are memory-mapped too but have to be decoded.
+    """
+    if path.endswith(".parquet"):
+        return pq.read_table(path, memory_map=True)
+    with pa.memory_map(path) as source:
+        return ipc.open_stream(source).read_all()
+
+
+def load_table(name, directory=COLUMNAR_DATASET_DIR):
+    """Zero-copy `pyarrow.Table` of dataset `name`, see `dataset_path` and `read_table`."""
+    return read_table(dataset_path(name, directory))
+
+
+def load_hf_dataset(name, directory=COLUMNAR_DATASET_DIR):
+    """`datasets.Dataset` of dataset `name`, memory-mapped from its Arrow file."""
+    return Dataset.from_file(dataset_path(name, directory))
@@ -0,0 +1,171 @@
+import torch
+
+from utils.intent_templates import OUTPUT_SLOTS, BILLS, ACCOUNTS
+
+# Returned by a piece when the text ends before the piece does
+_PARTIAL = -1
+
+
+class Literal:
+    def __init__(self, text):
+        self.text = text
+        self.max_length = len(text)
+
+    def advance(self, text, pos):
+        remaining = text[pos:pos + len(self.text)]
+        if len(remaining) < len(self.text):
+            if self.text.startswith(remaining):
+                yield _PARTIAL
+        elif remaining == self.text:
+            yield pos + len(self.text)
+
+
+class Choice:
+    def __init__(self, options):
+        self.options = [Literal(option) for option in options]
+        self.max_length = max(option.max_length for option in self.options)
+
+    def advance(self, text, pos):
+        partial = False
+        for option in self.options:
+            for end in option.advance(text, pos):
+                if end == _PARTIAL:
+                    partial = True
+                else:
+                    yield end
+        if partial:
+            yield _PARTIAL
+
+
+class Integer:
+    def __init__(self, max_digits=9):
+        self.max_digits = max_digits
+        self.max_length = max_digits
+
+    def advance(self, text, pos):
+        end = pos
+        while end < len(text) and text[end].isdigit() and end - pos < self.max_digits:
+            end += 1
+        if end == pos or (text[pos] == "0" and end - pos > 1):
+            return
+        # A number that runs to the end of the text may still grow
+        yield _PARTIAL if end == len(text) else end
+
+
+class Text:
+    """A short quoted-string body made of letters, spaces, apostrophes and hyphens."""
+
+    def __init__(self, max_length=40):
+        self.max_length = max_length
+
+    def advance(self, text, pos):
+        end = pos
+        while end < len(text) and end - pos < self.max_length and (text[end].isalpha() or text[end] in " '-"):
+            end += 1
+        if end == len(text):
+            yield _PARTIAL
+        elif end > pos:
+            yield end
+
+
+def _match(pieces, text, pos=0, index=0):
+    """Return the set of outcomes ("complete", "prefix") for `text[pos:]` against `pieces[index:]`."""
+    if pos == len(text):
+        return {"complete"} if index == len(pieces) else {"prefix"}
+    if index == len(pieces):
+        return set()
+    outcomes = set()
+    for end in pieces[index].advance(text, pos):
+        if end == _PARTIAL:
+            outcomes.add("prefix")
+        else:
+            outcomes |= _match(pieces, text, end, index + 1)
+    return outcomes
+
+
+class IntentJsonGrammar:
+    """Character-level grammar of the intent JSON objects the OPT model is trained to emit.
+
+    One alternative per intent, e.g.
+    `{"intent": "Send money", "amount": 50, "recipient": "John"}`, using the
+    key order and `json.dumps` spacing of mistral_dataset_generation.py.
+    Bills and accounts are restricted to the known values, recipients to a
+    short name. The object opens right away: the prompt already ends with
+    the newline the answer follows, as in training.
+    """
+
+    SLOT_PIECES = {
+        "amount": lambda: [Integer()],
+        "recipient": lambda: [Literal('"'), Text(), Literal('"')],
+        "bill": lambda: [Literal('"'), Choice(BILLS), Literal('"')],
+        "account": lambda: [Literal('"'), Choice(ACCOUNTS), Literal('"')],
+    }
+
+    def __init__(self, output_slots=OUTPUT_SLOTS):
+        self.alternatives = []
+        for intent, slots in output_slots.items():
+            pieces = [Literal('{"intent": "' + intent + '"')]
+            for slot in slots:
+                pieces.append(Literal(f', "{slot}": '))
+                pieces.extend(self.SLOT_PIECES[slot]())
+            pieces.append(Literal("}"))
+            self.alternatives.append(pieces)
+        # Longest text the grammar accepts
+        self.max_length = max(sum(piece.max_length for piece in pieces) for pieces in self.alternatives)
+
+    def outcomes(self, text):
+        outcomes = set()
+        for pieces in self.alternatives:
+            outcomes |= _match(pieces, text)
+        return outcomes
+
+    def is_prefix(self, text):
+        return bool(self.outcomes(text))
+
+    def is_complete(self, text):
+        return "complete" in self.outcomes(text)
+
+
+class ConstrainedDecoder:
+    """Greedy token selection restricted to continuations the grammar accepts.
+
+    Token strings are decoded once up front. Each step walks the logits from
+    the highest down and returns the first token that keeps the generated
+    text a valid prefix, so usually only a handful of tokens are checked.
+    Every token adds at least one character, so the object closes within
+    `max_tokens` tokens whatever the model prefers.
+
+    Args:
+        tokenizer: Tokenizer of the model being decoded.
+        grammar: Object with `is_prefix(text)`, `is_complete(text)` and the
+            `max_length` of the texts it accepts.
+        top_k (int): Candidates checked before falling back to the full vocabulary.
+    """
+
+    def __init__(self, tokenizer, grammar=None, top_k=64):
+        self.grammar = grammar or IntentJsonGrammar()
+        self.top_k = top_k
+        self.max_tokens = self.grammar.max_length
+        self.token_texts = [
+            tokenizer.decode([token_id], clean_up_tokenization_spaces=False)
+            for token_id in range(len(tokenizer))
+        ]
+
+    def is_complete(self, text):
+        return self.grammar.is_complete(text)
+
+    def next_token(self, logits, text):
+        """Return the best allowed token id after `text`, or None if nothing is allowed."""
+        top_k = min(self.top_k, logits.shape[-1])
+        candidates = torch.topk(logits, top_k).indices.tolist()
+        for token_id in candidates:
+            if self._allowed(token_id, text):
+                return token_id
+        for token_id in torch.argsort(logits, descending=True)[top_k:].tolist():
+            if self._allowed(token_id, text):
+                return token_id
+        return None
+
+    def _allowed(self, token_id, text):
+        token_text = self.token_texts[token_id]
+        return bool(token_text) and self.grammar.is_prefix(text + token_text)
@@ -0,0 +1,291 @@
+import io
+import itertools
+import json
+import math
+import os
+import zlib
+from collections import Counter
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+
+from utils.synthetic_intents import BATCH_SIZE, SCHEMAS, json_lines
+
+# Rows whose estimated Jaccard similarity of character n-grams with an already
+# kept row reaches DEDUP_THRESHOLD are dropped as near duplicates
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.8))
+NUM_PERM = 128
+NGRAM = 4
+# Texts hashed per NumPy call, which bounds the (shingles, num_perm) intermediate array
+SIGNATURE_CHUNK = 512
+
+# Text column and intent of a row for the layouts of utils/synthetic_intents.SCHEMAS
+_OUTPUT_INTENT_PATTERN = r'"intent": "(?P<intent>[^"]*)"'
+
+
+def normalize_text(text):
+    # Case, repeated whitespace and trailing punctuation do not make a query different
+    return " ".join(text.lower().split()).rstrip("?!. ")
+
+
+def shingle_hashes(text, ngram=NGRAM):
+    """32-bit hashes of the distinct character n-grams of `text` (the whole text if shorter)."""
+    encoded = text.encode()
+    if len(encoded) <= ngram:
+        return {zlib.crc32(encoded)}
+    return {zlib.crc32(encoded[i:i + ngram]) for i in range(len(encoded) - ngram + 1)}
+
+
+def lsh_params(threshold, num_perm):
+    """Pick `(bands, rows)` with bands * rows <= num_perm for an LSH index at `threshold`.
+
+    A pair of similarity s shares at least one band with probability
+    1 - (1 - s^rows)^bands. The pair minimizing the area of false positives
+    below the threshold plus false negatives above it is returned.
+    """
+    best, best_error = None, float("inf")
+    low, high = np.linspace(0, threshold, 200), np.linspace(threshold, 1, 200)
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        false_positives = np.trapezoid(1 - (1 - low ** rows) ** bands, low)
+        false_negatives = np.trapezoid((1 - high ** rows) ** bands, high)
+        if false_positives + false_negatives < best_error:
+            best, best_error = (bands, rows), false_positives + false_negatives
+    return best
+
+
+class MinHasher:
+    """MinHash signatures of `num_perm` hash functions over character n-grams.
+
+    The functions are multiply-shift hashes, the high 32 bits of
+    (a * x + b) mod 2^64 for random odd a, which need no modulo.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, ngram=NGRAM, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.ngram = ngram
+
+    def signatures(self, texts):
+        """Return a `(len(texts), num_perm)` uint32 array, one signature per text.
+
+        The shingles of SIGNATURE_CHUNK texts are hashed together and reduced
+        per text, instead of one NumPy call per text.
+        """
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(texts), SIGNATURE_CHUNK):
+            hashes = [
+                np.fromiter(shingle_hashes(text, self.ngram), dtype=np.uint64)
+                for text in texts[start:start + SIGNATURE_CHUNK]
+            ]
+            starts = np.cumsum([0] + [len(h) for h in hashes[:-1]])
+            permuted = (np.concatenate(hashes)[:, None] * self.a + self.b) >> np.uint64(32)
+            signatures[start:start + len(hashes)] = np.minimum.reduceat(permuted, starts, axis=0)
+        return signatures
+
+
+class NearDuplicateFilter:
+    """Streaming exact and near-duplicate filter with optional per-intent caps.
+
+    Rows are seen once, in order: a row is kept unless its normalized text was
+    already kept or dropped as a duplicate (exact duplicate), its MinHash
+    signature shares an LSH band with a kept row of estimated Jaccard
+    similarity >= `threshold` (near duplicate), or its intent already has
+    `max_per_intent` kept rows. Only the kept rows are indexed, so memory
+    grows with the deduplicated data.
+
+    Args:
+        threshold (float): Jaccard similarity of character n-grams from which
+            two texts are duplicates.
+        num_perm (int): Hash functions per signature.
+        ngram (int): Length of the character shingles, in bytes.
+        max_per_intent (int): Rows kept per intent, unlimited when None.
+        normalize (callable): Text transform applied before comparing, e.g.
+            `utils.intent_templates.normalize_query` to compare templates only.
+        seed (int): Seed of the hash functions.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, num_perm=NUM_PERM, ngram=NGRAM, max_per_intent=None,
+                 normalize=normalize_text, seed=0):
+        self.threshold = threshold
+        self.max_per_intent = max_per_intent
+        self.normalize = normalize
+        self.hasher = MinHasher(num_perm, ngram, seed)
+        self.bands, self.rows_per_band = lsh_params(threshold, num_perm)
+        # Random odd multipliers folding the slots of a band into one 64-bit bucket key
+        self.band_weights = np.random.default_rng(seed).integers(
+            0, 1 << 63, self.rows_per_band, dtype=np.uint64
+        ) * np.uint64(2) + np.uint64(1)
+        self.buckets = [{} for _ in range(self.bands)]
+        # Signatures of the kept rows, grown by doubling
+        self.signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self.num_indexed = 0
+        self.seen = set()
+        self.kept_per_intent = Counter()
+        self.counts = Counter()
+
+    def band_keys(self, signatures):
+        """Bucket key of every LSH band of every signature, as a list of lists of ints."""
+        bands = signatures[:, :self.bands * self.rows_per_band].reshape(len(signatures), self.bands, -1)
+        return (bands.astype(np.uint64) * self.band_weights).sum(axis=2).tolist()
+
+    def _near_duplicate(self, signature, keys):
+        candidates = set()
+        for bucket, key in zip(self.buckets, keys):
+            candidates.update(bucket.get(key, ()))
+        if not candidates:
+            return False
+        # Estimated Jaccard similarity: share of equal signature slots
+        agreement = np.count_nonzero(self.signatures[list(candidates)] == signature, axis=1)
+        return agreement.max() >= self.threshold * len(signature)
+
+    def _index(self, signature, keys):
+        index = self.num_indexed
+        if index == len(self.signatures):
+            self.signatures = np.concatenate([self.signatures, np.empty_like(self.signatures)])
+        self.signatures[index] = signature
+        self.num_indexed += 1
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, []).append(index)
+
+    def filter(self, texts, intents=None):
+        """Return a boolean mask of the rows to keep, updating the index with them."""
+        normalized = [self.normalize(text) for text in texts]
+        intents = intents if intents is not None else [None] * len(texts)
+        # Only texts never seen before need a signature
+        fresh = {text: None for text in normalized if text not in self.seen}
+        signatures = self.hasher.signatures(list(fresh))
+        for text, signature, keys in zip(fresh, signatures, self.band_keys(signatures)):
+            fresh[text] = signature, keys
+        mask = np.zeros(len(texts), dtype=bool)
+        for row, (text, intent) in enumerate(zip(normalized, intents)):
+            self.counts["rows"] += 1
+            if text in self.seen:
+                self.counts["exact_duplicates"] += 1
+            elif self._near_duplicate(*fresh[text]):
+                # Later copies of this text are exact duplicates of the row it was close to
+                self.seen.add(text)
+                self.counts["near_duplicates"] += 1
+            elif self.max_per_intent is not None and self.kept_per_intent[intent] >= self.max_per_intent:
+                self.counts["capped"] += 1
+            else:
+                self.seen.add(text)
+                self._index(*fresh[text])
+                self.kept_per_intent[intent] += 1
+                self.counts["kept"] += 1
+                mask[row] = True
+        return mask
+
+    def filter_table(self, table):
+        """Keep the rows of a table in one of the SCHEMAS layouts that are not duplicates."""
+        texts, intents = table_texts_and_intents(table)
+        return table.filter(pa.array(self.filter(texts, intents)))
+
+    def stats(self):
+        return {
+            "rows": self.counts["rows"],
+            "kept": self.counts["kept"],
+            "exact_duplicates": self.counts["exact_duplicates"],
+            "near_duplicates": self.counts["near_duplicates"],
+            "capped": self.counts["capped"],
+            "kept_per_intent": dict(sorted(self.kept_per_intent.items(), key=str)),
+            "threshold": self.threshold,
+            "lsh_bands": self.bands,
+            "lsh_rows_per_band": self.rows_per_band,
+        }
+
+
+def table_texts_and_intents(table):
+    """Query texts and intents of a table in the "csv" or "instruction" layout."""
+    if "User Query" in table.column_names:
+        return table.column("User Query").to_pylist(), table.column("Action").to_pylist()
+    intents = pc.extract_regex(table.column("output"), _OUTPUT_INTENT_PATTERN)
+    return table.column("input").to_pylist(), pc.struct_field(intents, "intent").to_pylist()
+
+
+def read_tables(path, batch_size=BATCH_SIZE):
+    """Yield a CSV, JSON lines, JSON list or Parquet file as tables of at most `batch_size` rows."""
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(batch_size):
+            yield pa.Table.from_batches([batch])
+    elif path.endswith(".csv"):
+        # Amounts stay float64 as in the file ("1782.0" next to empty cells)
+        options = pa_csv.ConvertOptions(strings_can_be_null=True)
+        with pa_csv.open_csv(path, convert_options=options) as reader:
+            for batch in reader:
+                yield pa.Table.from_batches([batch])
+    elif path.endswith(".jsonl"):
+        with open(path, "rb") as f:
+            while True:
+                lines = list(itertools.islice(f, batch_size))
+                if not lines:
+                    break
+                yield pa_json.read_json(io.BytesIO(b"".join(lines)))
+    else:
+        with open(path) as f:
+            rows = json.load(f)
+        layout = "csv" if rows and "User Query" in rows[0] else "instruction"
+        for start in range(0, len(rows), batch_size):
+            yield pa.Table.from_pylist(rows[start:start + batch_size], SCHEMAS[layout])
+
+
+def write_tables(path, tables):
+    """Write tables to `path` in the format of its extension and return the number of rows."""
+    count = 0
+    if path.endswith(".parquet"):
+        writer = None
+        for table in tables:
+            writer = writer or pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+            count += table.num_rows
+        if writer is not None:
+            writer.close()
+    elif path.endswith(".csv"):
+        writer = None
+        with open(path, "wb") as f:
+            for table in tables:
+                writer = writer or pa_csv.CSVWriter(f, table.schema)
+                writer.write_table(table)
+                count += table.num_rows
+            if writer is not None:
+                writer.close()
+    elif path.endswith(".jsonl"):
+        with open(path, "wb") as f:
+            for table in tables:
+                f.write(json_lines(table))
+                count += table.num_rows
+    else:
+        rows = [row for table in tables for row in table.to_pylist()]
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2)
+        count = len(rows)
+    return count
+
+
+def dedup_files(paths, output_dir, dedup_filter, batch_size=BATCH_SIZE):
+    """Stream every file of `paths` through one filter into `output_dir`, under the same names.
+
+    Duplicates are detected across files, so sharded data is deduplicated as
+    a whole while only one batch of rows is in memory at a time.
+
+    Returns:
+        list: `(input path, output path, rows kept)` for every file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    for path in paths:
+        output = os.path.join(output_dir, os.path.basename(path))
+        kept = write_tables(output, (dedup_filter.filter_table(table) for table in read_tables(path, batch_size)))
+        results.append((path, output, kept))
+    return results
+
+
+def training_steps(num_rows, batch_size, epochs):
+    # Optimizer steps of a single-device Trainer run without gradient accumulation
+    return math.ceil(num_rows / batch_size) * epochs
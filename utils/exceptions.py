@@ -11,3 +11,38 @@ class UnslothNotInstalledError(ImportError):
     ):
         self.message = message
         super().__init__(self.message)
+
+
+class ServerOverloadedError(RuntimeError):
+    """Exception raised when the inference pool has no free slot for a request.
+
+    The request is rejected straight away instead of being queued behind work
+    that would push it past its deadline.
+    """
+
+    def __init__(self, message="Inference pool is saturated, retry later"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class InferenceTimeoutError(TimeoutError):
+    """Exception raised when a model call does not finish within the request timeout."""
+
+    def __init__(self, message="Inference did not finish within the request timeout"):
+        self.message = message
+        super().__init__(self.message)
+
+
+class OnnxRuntimeNotInstalledError(ImportError):
+    """Exception raised when the ONNX backend is selected without onnxruntime.
+
+    Install onnxruntime (and onnx to export the graph) or pick the eager or
+    torchscript backend instead.
+    """
+
+    def __init__(
+        self,
+        message="onnxruntime is required for the onnx backend. Install it with `pip install onnx onnxruntime`",
+    ):
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,31 @@
+from utils.bucketing import LABEL_PAD_TOKEN_ID
+
+
+def tokenize_completion_only(tokenizer, prompts, completions, max_length, label_pad_token_id=LABEL_PAD_TOKEN_ID):
+    """Tokenize `prompt + completion` pairs with only the completion in the loss.
+
+    Labels are the input ids, except for tokens that start inside the prompt
+    (special tokens, instruction and input), which get `label_pad_token_id`.
+    Padding is masked later by the collator. Needs a fast tokenizer for the
+    character offsets.
+
+    Args:
+        tokenizer: Fast tokenizer of the model being fine-tuned.
+        prompts (list): Instruction and input text, including the separator
+            the completion follows.
+        completions (list): Text the model should learn to produce.
+        max_length (int): Truncation length of the concatenated text.
+
+    Returns:
+        dict: `input_ids`, `attention_mask` and `labels` lists, for `datasets.map`.
+    """
+    texts = [prompt + completion for prompt, completion in zip(prompts, completions)]
+    encoded = tokenizer(texts, truncation=True, max_length=max_length, return_offsets_mapping=True)
+    labels = []
+    for input_ids, offsets, prompt in zip(encoded["input_ids"], encoded.pop("offset_mapping"), prompts):
+        labels.append([
+            token_id if start >= len(prompt) and end > start else label_pad_token_id
+            for token_id, (start, end) in zip(input_ids, offsets)
+        ])
+    encoded["labels"] = labels
+    return encoded
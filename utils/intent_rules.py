@@ -0,0 +1,135 @@
+import re
+import threading
+from collections import deque
+
+from utils.intent_templates import ACTIONS, RECIPIENTS, BILLS, ACCOUNTS
+
+_TOKEN_PATTERN = re.compile(r"\{\w+\}|\$?\d[\d,]*(?:\.\d+)?|\w+|[^\w\s]")
+_AMOUNT_PATTERN = re.compile(r"\$?\d[\d,]*(?:\.\d+)?")
+_TRAILING_PUNCTUATION = {"?", "!", "."}
+
+# Slot vocabularies, keyed by the lowercased token and mapped back to the canonical value
+_SLOT_VALUES = {
+    "recipient": {value.lower(): value for value in RECIPIENTS},
+    "bill": {value.lower(): value for value in BILLS},
+    "account": {value.lower(): value for value in ACCOUNTS},
+}
+
+
+def tokenize(text):
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    while tokens and tokens[-1] in _TRAILING_PUNCTUATION:
+        tokens.pop()
+    return tokens
+
+
+def parse_amount(token):
+    if not _AMOUNT_PATTERN.fullmatch(token):
+        return None
+    value = float(token.lstrip("$").replace(",", ""))
+    return int(value) if value.is_integer() else value
+
+
+class _Node:
+    __slots__ = ("literals", "slots", "actions")
+
+    def __init__(self):
+        self.literals = {}
+        self.slots = {}
+        self.actions = set()
+
+
+class TemplateMatcher:
+    """Matches queries against the generator templates without running a model.
+
+    Every template is compiled into a token trie. Literal tokens are matched
+    exactly (case-insensitive) and `{amount}`, `{recipient}`, `{bill}` and
+    `{account}` slots match a number or a known slot value. A query that ends
+    on exactly one action is answered with that action and its slot values,
+    in the same shape as the outputs in mtn_chatbot_dataset.json.
+
+    Args:
+        templates (dict): Maps an action to its list of query templates.
+    """
+
+    def __init__(self, templates=ACTIONS):
+        self._root = _Node()
+        for action, action_templates in templates.items():
+            for template in action_templates:
+                self._add(action, template)
+
+    def _add(self, action, template):
+        node = self._root
+        for token in tokenize(template):
+            if token.startswith("{") and token.endswith("}"):
+                node = node.slots.setdefault(token[1:-1], _Node())
+            else:
+                node = node.literals.setdefault(token, _Node())
+        node.actions.add(action)
+
+    def match(self, query):
+        """Return `{"intent": ..., <slots>}` for a templated query, or None."""
+        tokens = tokenize(query)
+        matches = {}
+        self._walk(self._root, tokens, 0, {}, matches)
+        if len(matches) != 1:
+            # No template, or templates of different intents: leave it to the model
+            return None
+        action, slots = next(iter(matches.items()))
+        output = {"intent": action}
+        output.update(slots)
+        return output
+
+    def _walk(self, node, tokens, position, slots, matches):
+        if position == len(tokens):
+            for action in node.actions:
+                matches.setdefault(action, dict(slots))
+            return
+        token = tokens[position]
+        child = node.literals.get(token)
+        if child is not None:
+            self._walk(child, tokens, position + 1, slots, matches)
+        for slot, child in node.slots.items():
+            value = parse_amount(token) if slot == "amount" else _SLOT_VALUES[slot].get(token)
+            if value is not None:
+                self._walk(child, tokens, position + 1, dict(slots, **{slot: value}), matches)
+
+
+class RuleAgreement:
+    """Counts how often the template matcher and the model agree on the intent."""
+
+    def __init__(self, keep_disagreements=20):
+        self._lock = threading.Lock()
+        self.rule_hits = 0
+        self.rule_misses = 0
+        self.compared = 0
+        self.agreed = 0
+        self.disagreements = deque(maxlen=keep_disagreements)
+
+    def record_lookup(self, matched):
+        with self._lock:
+            if matched:
+                self.rule_hits += 1
+            else:
+                self.rule_misses += 1
+
+    def record_comparison(self, query, rule_action, model_action):
+        with self._lock:
+            self.compared += 1
+            if rule_action == model_action:
+                self.agreed += 1
+            else:
+                self.disagreements.append({"query": query, "rules": rule_action, "model": model_action})
+
+    def stats(self):
+        with self._lock:
+            lookups = self.rule_hits + self.rule_misses
+            return {
+                "rule_hits": self.rule_hits,
+                "rule_misses": self.rule_misses,
+                "rule_hit_rate": round(self.rule_hits / lookups, 4) if lookups else 0.0,
+                "compared": self.compared,
+                "agreed": self.agreed,
+                "agreement_rate": round(self.agreed / self.compared, 4) if self.compared else None,
+                "recent_disagreements": list(self.disagreements),
+            }
@@ -0,0 +1,58 @@
+import re
+
+# Template spec shared by tiny_bert_dataset_generation.py and mistral_dataset_generation.py
+
+INSTRUCTION = "Classify the intent and extract parameters from the user query."
+
+# Define possible actions and their corresponding queries
+ACTIONS = {
+    "Send money": ["Send {amount} ZAR to {recipient}", "Transfer {amount} ZAR to {recipient}", "I want to send {amount} ZAR to {recipient}"],
+    "Check balance": ["Check my balance", "What is my current balance?", "How much money do I have?"],
+    "Pay bill": ["Pay my {bill} bill", "I need to pay {amount} ZAR for my {bill}", "Pay {amount} ZAR for {bill}"],
+    "Apply for loan": ["Apply for a loan of {amount} ZAR", "I want to borrow {amount} ZAR", "Can I get a loan for {amount} ZAR?"],
+    "Check loan": ["How much do I owe on my loan?", "What is my loan balance?", "Check my loan status"],
+    "Transfer money": ["Transfer {amount} ZAR to my {account}", "Move {amount} ZAR to {account}", "Send {amount} ZAR to {account}"],
+}
+
+# Define possible recipients, bills, and accounts
+RECIPIENTS = ["John", "Sarah", "Mike", "Jane", "David", "Emma"]
+BILLS = ["electricity", "water", "internet", "rent", "phone"]
+ACCOUNTS = ["savings", "checking", "investment"]
+
+# Amount range (inclusive) sampled for each action that takes an amount
+AMOUNT_RANGES = {
+    "Send money": (50, 10000),
+    "Pay bill": (100, 5000),
+    "Apply for loan": (1000, 50000),
+    "Transfer money": (50, 10000),
+}
+
+# Values sampled for the other slots
+SLOT_VALUES = {"recipient": RECIPIENTS, "bill": BILLS, "account": ACCOUNTS}
+
+# Keys of each JSON output written by mistral_dataset_generation.py, in order after "intent".
+# The generators sample exactly these slots for each action.
+OUTPUT_SLOTS = {
+    "Send money": ["amount", "recipient"],
+    "Check balance": [],
+    "Pay bill": ["amount", "bill"],
+    "Apply for loan": ["amount"],
+    "Check loan": [],
+    "Transfer money": ["amount", "account"],
+}
+
+_AMOUNT_PATTERN = re.compile(r"[$]?\d[\d,]*(?:\.\d+)?")
+_RECIPIENT_PATTERN = re.compile(r"\b(?:" + "|".join(name.lower() for name in RECIPIENTS) + r")\b")
+
+
+def normalize_query(query):
+    """Reduce a query to the template it was most likely written from.
+
+    Case, surrounding whitespace and trailing punctuation are dropped, amounts
+    become `{amount}` and known recipient names become `{recipient}`, so
+    "Send 50 ZAR to John" and "send 1,200 ZAR to Sarah!" share one key.
+    Bills and accounts are kept because they decide between intents.
+    """
+    text = " ".join(query.lower().split()).rstrip("?!. ")
+    text = _AMOUNT_PATTERN.sub("{amount}", text)
+    return _RECIPIENT_PATTERN.sub("{recipient}", text)
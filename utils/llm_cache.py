@@ -0,0 +1,80 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+# SQLite caps the number of parameters of one statement
+_LOOKUP_CHUNK = 500
+
+
+class LLMResultCache:
+    """Persistent cache of LLM answers in SQLite, keyed by hash(prompt, model, text).
+
+    Writes go through `put_many`, one transaction per call, so whatever was
+    committed survives a crash and a rerun only sends unseen texts.
+
+    Args:
+        path (str): SQLite file, created with its directory if missing.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, model TEXT, text TEXT, result TEXT, created_at REAL)"
+        )
+        self._connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(prompt, model, text):
+        digest = hashlib.sha256()
+        for part in (prompt, model, text):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """Return `{key: result}` for the keys that are cached."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        for start in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = keys[start:start + _LOOKUP_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._connection.execute(
+                f"SELECT key, result FROM results WHERE key IN ({placeholders})", chunk
+            )
+            found.update(rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries):
+        """Store `(key, model, text, result)` tuples in one transaction."""
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO results (key, model, text, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, model, text, result, now) for key, model, text, result in entries],
+            )
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,65 @@
+import threading
+
+
+class ModelRegistry:
+    """Process-wide store of loaded models.
+
+    Models are registered by name together with a loader callable. The first
+    call to `get` runs the loader and keeps the result resident, so every later
+    request reuses the same object instead of deserializing it from disk again.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._reload_hooks = []
+        self._lock = threading.RLock()
+
+    def register(self, name, loader):
+        """Register a loader for a model name. Re-registering drops the resident copy."""
+        with self._lock:
+            self._loaders[name] = loader
+            self._models.pop(name, None)
+
+    def get(self, name):
+        """Return the resident model, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                if name not in self._loaders:
+                    raise KeyError(f"No model registered under '{name}'")
+                self._models[name] = self._loaders[name]()
+            return self._models[name]
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warm_up(self, *names):
+        """Load the given models (all registered models by default) ahead of traffic."""
+        for name in names or list(self._loaders):
+            self.get(name)
+
+    def reload(self, name):
+        """Reload a model from its loader and notify the reload hooks.
+
+        The old copy keeps serving until the new one is fully loaded.
+        """
+        with self._lock:
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            self._models[name] = self._loaders[name]()
+            hooks = list(self._reload_hooks)
+        for hook in hooks:
+            hook(name)
+        return self._models[name]
+
+    def on_reload(self, hook):
+        """Register `hook(name)` to be called after a model is reloaded."""
+        with self._lock:
+            self._reload_hooks.append(hook)
+        return hook
+
+
+registry = ModelRegistry()
@@ -0,0 +1,86 @@
+import torch
+
+from utils.bucketing import LABEL_PAD_TOKEN_ID, LengthBucketCollator
+
+
+def pack_examples(lengths, max_length):
+    """Group example indices into bins of at most `max_length` tokens, first-fit decreasing."""
+    order = sorted(range(len(lengths)), key=lambda index: lengths[index], reverse=True)
+    bins = []
+    free = []
+    for index in order:
+        length = lengths[index]
+        for position, space in enumerate(free):
+            if length <= space:
+                bins[position].append(index)
+                free[position] -= length
+                break
+        else:
+            bins.append([index])
+            free.append(max_length - length)
+    return bins
+
+
+def pack_batch(examples, max_length, label_pad_token_id=LABEL_PAD_TOKEN_ID):
+    """`datasets.map` function concatenating tokenized examples into packed rows.
+
+    Every row carries `input_ids`, `labels` and `position_ids` restarting at
+    0 for each example, which `PackedSequenceCollator` uses to keep examples
+    from attending to each other. The first token of each example is
+    removed from the loss, as predicting it from the previous example is
+    meaningless.
+    """
+    input_ids = examples["input_ids"]
+    labels = examples["labels"] if "labels" in examples else input_ids
+    packed = {"input_ids": [], "labels": [], "position_ids": []}
+    for indices in pack_examples([len(ids) for ids in input_ids], max_length):
+        row = {key: [] for key in packed}
+        for index in indices:
+            row["input_ids"].extend(input_ids[index])
+            row["labels"].extend([label_pad_token_id] + list(labels[index][1:]))
+            row["position_ids"].extend(range(len(input_ids[index])))
+        for key, values in row.items():
+            packed[key].append(values)
+    return packed
+
+
+def pack_dataset(dataset, max_length, batch_size=1000):
+    """Pack a tokenized dataset (`input_ids`, optional `labels`) into rows of up to `max_length` tokens."""
+    return dataset.map(
+        pack_batch,
+        batched=True,
+        batch_size=batch_size,
+        remove_columns=dataset.column_names,
+        fn_kwargs={"max_length": max_length},
+    )
+
+
+class PackedSequenceCollator(LengthBucketCollator):
+    """Collates rows from `pack_dataset` with a block-diagonal causal mask.
+
+    `attention_mask` is a 4D additive mask (0 to attend, the dtype minimum
+    to mask) that lets each token see only earlier tokens of its own
+    example; padding only sees padding. Models taking 4D masks and
+    `position_ids`, such as OPT, then compute the same loss as if the
+    examples had been batched separately.
+    """
+
+    def __init__(self, tokenizer, label_pad_token_id=LABEL_PAD_TOKEN_ID, dtype=torch.float32):
+        super().__init__(tokenizer, label_pad_token_id)
+        self.padding_side = "right"
+        self.dtype = dtype
+
+    def __call__(self, features):
+        batch = super().__call__(features)
+        length = batch["input_ids"].shape[1]
+        # Segment number of every token, -1 for padding
+        segment_ids = torch.full((len(features), length), -1, dtype=torch.long)
+        for row, feature in enumerate(features):
+            position_ids = torch.tensor(feature["position_ids"])
+            segment_ids[row, :len(position_ids)] = (position_ids == 0).cumsum(0)
+        same_segment = segment_ids[:, :, None] == segment_ids[:, None, :]
+        causal = torch.ones(length, length, dtype=torch.bool).tril()
+        attention_mask = torch.zeros(same_segment.shape, dtype=self.dtype)
+        attention_mask.masked_fill_(~(same_segment & causal), torch.finfo(self.dtype).min)
+        batch["attention_mask"] = attention_mask[:, None]
+        return batch
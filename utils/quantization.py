@@ -0,0 +1,65 @@
+import glob
+import hashlib
+import os
+
+import torch
+from transformers import AutoConfig
+
+# Written by quantize_models.py next to the fp32 weights of each fine-tuned model
+INT8_WEIGHTS_FILE = "model.int8.pt"
+# Set USE_INT8_WEIGHTS=0 to keep serving the fp32 weights even when an int8 variant exists
+USE_INT8_WEIGHTS = os.getenv("USE_INT8_WEIGHTS", "1") != "0"
+
+
+def quantize_dynamic_int8(model):
+    """Return a copy of `model` with every nn.Linear holding int8 weights.
+
+    Activations stay fp32 and are quantized on the fly, so no calibration
+    data is needed.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=False)
+
+
+def int8_weights_path(model_path):
+    return os.path.join(model_path, INT8_WEIGHTS_FILE)
+
+
+def fp32_weights_hash(model_path):
+    """Hash of the fp32 weight files `save_pretrained` wrote to `model_path` (sharded or not)."""
+    digest = hashlib.sha256()
+    paths = sorted(glob.glob(os.path.join(model_path, "model*.safetensors"))
+                   + glob.glob(os.path.join(model_path, "pytorch_model*.bin")))
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_int8(model, model_path):
+    """Save the int8 state dict together with the hash of the fp32 weights it was quantized from."""
+    path = int8_weights_path(model_path)
+    torch.save({"fp32_sha256": fp32_weights_hash(model_path), "state_dict": model.state_dict()}, path)
+    return path
+
+
+def load_int8(model_class, model_path):
+    """Load the int8 variant of a fine-tuned model, or None if there is none.
+
+    The module structure is rebuilt from config.json and quantized the same
+    way before the saved int8 state dict is loaded into it. A variant
+    quantized from other fp32 weights, e.g. before the model was fine-tuned
+    again, is ignored until quantize_models.py is run again.
+    """
+    path = int8_weights_path(model_path)
+    if not USE_INT8_WEIGHTS or not os.path.exists(path):
+        return None
+    saved = torch.load(path)
+    if not isinstance(saved, dict) or saved.get("fp32_sha256") != fp32_weights_hash(model_path):
+        print(f"Ignoring {path}: it was quantized from other fp32 weights, serving fp32")
+        return None
+    model = quantize_dynamic_int8(model_class.from_config(AutoConfig.from_pretrained(model_path)))
+    model.load_state_dict(saved["state_dict"])
+    model.eval()
+    return model
@@ -0,0 +1,229 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class SemanticCache:
+    """Thread-safe cache of answers looked up by embedding similarity instead of exact text.
+
+    Entries live in a preallocated `(maxsize, dim)` matrix of unit vectors, so
+    a lookup is one matrix-vector product over the live entries followed by
+    an argmax: exact nearest-neighbour search, which for a few thousand
+    entries costs well under a millisecond and needs no index rebuilds when
+    entries are evicted. A lookup returns the most similar cached question
+    with a cosine similarity of at least `threshold` and the same `guard`
+    value. When full, the least recently used entry is evicted.
+
+    `get_or_compute` coalesces concurrent misses: a question matching one
+    whose answer is being computed waits for that answer instead of calling
+    `compute` again. `put` does not add a question matching a live entry, so
+    racing writers never fill the cache with near copies.
+
+    Args:
+        embed (callable): Maps a list of texts to an `(n, dim)` array of
+            L2-normalized embeddings.
+        dim (int): Size of the embeddings.
+        threshold (float): Smallest cosine similarity of a hit.
+        maxsize (int): Number of entries kept before evicting.
+        ttl (float): Seconds an entry stays valid, or None to keep entries
+            until they are evicted.
+        guard (callable): Maps a text to a value that must be equal between
+            the question and the cached one for a hit, e.g. the numbers it
+            contains, since embeddings barely tell "UGX 5,000" from "UGX 50,000".
+    """
+
+    def __init__(self, embed, dim, threshold=0.9, maxsize=4096, ttl=None, guard=None):
+        self.embed = embed
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.guard = guard
+        self._vectors = np.zeros((maxsize, dim), dtype=np.float32)
+        self._live = np.zeros(maxsize, dtype=bool)
+        self._expires_at = np.full(maxsize, np.inf)
+        self._last_used = np.zeros(maxsize)
+        self._entries = [None] * maxsize
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.guard_rejections = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.coalesced = 0
+        self.duplicate_puts = 0
+        self._hit_similarity = 0.0
+        # (question, vector, guard value, Future) of the misses being computed
+        self._pending = []
+        # Incremented by clear(), so answers computed before it are dropped
+        self._generation = 0
+        self.stale_puts = 0
+
+    def _expire(self, now):
+        expired = self._live & (self._expires_at <= now)
+        if expired.any():
+            self._live &= ~expired
+            self.expirations += int(expired.sum())
+
+    def _guard_value(self, question):
+        return self.guard(question) if self.guard is not None else None
+
+    def _nearest(self, vector, guard_value, now):
+        """Return `(slot, similarity, rejected)` of the best live match, `slot` None without one.
+
+        `rejected` tells whether some entry was similar enough but had another
+        guard value. Called with the lock held.
+        """
+        self._expire(now)
+        scores = np.where(self._live, self._vectors @ vector, -np.inf)
+        candidates = np.flatnonzero(scores >= self.threshold)
+        # Most similar first, skipping the entries whose guard value differs
+        for slot in candidates[np.argsort(-scores[candidates])]:
+            if self._entries[slot][2] == guard_value:
+                return int(slot), float(scores[slot]), False
+        return None, None, bool(len(candidates))
+
+    def _lookup(self, vector, guard_value, now):
+        slot, similarity, rejected = self._nearest(vector, guard_value, now)
+        if slot is None:
+            self.guard_rejections += int(rejected)
+            self.misses += 1
+            return None
+        cached_question, answer, _ = self._entries[slot]
+        self._last_used[slot] = now
+        self.hits += 1
+        self._hit_similarity += similarity
+        return answer, similarity, cached_question
+
+    def lookup(self, question, vector=None):
+        """Return `(answer, similarity, cached_question)` of the nearest matching question, or None.
+
+        `vector` is the embedding of `question` when the caller already has it.
+        """
+        if vector is None:
+            vector = self.embed([question])[0]
+        guard_value = self._guard_value(question)
+        with self._lock:
+            return self._lookup(vector, guard_value, time.monotonic())
+
+    def get(self, question, default=None):
+        result = self.lookup(question)
+        return default if result is None else result[0]
+
+    def put(self, question, answer, vector=None, generation=None):
+        """Cache `answer` for `question`.
+
+        `generation` is the value of `generation()` when the answer was asked
+        for: if the cache was cleared since, the answer is dropped.
+        """
+        if vector is None:
+            vector = self.embed([question])[0]
+        guard_value = self._guard_value(question)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self.stale_puts += 1
+                return
+            now = time.monotonic()
+            slot, _, _ = self._nearest(vector, guard_value, now)
+            if slot is not None:
+                # Already answered, e.g. by a concurrent miss on a similar question
+                self._last_used[slot] = now
+                self.duplicate_puts += 1
+                return
+            free = np.flatnonzero(~self._live)
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(self._last_used.argmin())
+                self.evictions += 1
+            self._vectors[slot] = vector
+            self._entries[slot] = (question, answer, guard_value)
+            self._expires_at[slot] = now + self.ttl if self.ttl is not None else np.inf
+            self._last_used[slot] = now
+            self._live[slot] = True
+
+    def get_or_compute(self, question, compute, vector=None):
+        """Return the answer to `question`, from the cache or from `compute(question)`.
+
+        On a miss, if a matching question is already being computed by
+        another thread, its answer is awaited (or its error raised) instead.
+
+        Returns:
+            tuple: The answer, and `(similarity, matched_question)` when it
+                came from the cache or from a concurrent computation, None
+                when `compute` was called.
+        """
+        if vector is None:
+            vector = self.embed([question])[0]
+        guard_value = self._guard_value(question)
+        with self._lock:
+            result = self._lookup(vector, guard_value, time.monotonic())
+            if result is not None:
+                return result[0], result[1:]
+            waiting = None
+            for pending_question, pending_vector, pending_guard_value, future in self._pending:
+                similarity = float(pending_vector @ vector)
+                if similarity >= self.threshold and pending_guard_value == guard_value:
+                    waiting = future, (similarity, pending_question)
+                    self.coalesced += 1
+                    break
+            if waiting is None:
+                pending = (question, vector, guard_value, Future())
+                self._pending.append(pending)
+                generation = self._generation
+        if waiting is not None:
+            future, match = waiting
+            return future.result(), match
+        future = pending[3]
+        try:
+            answer = compute(question)
+            self.put(question, answer, vector, generation)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(answer)
+        finally:
+            with self._lock:
+                # Compared by identity; clear() may have dropped it already
+                self._pending = [entry for entry in self._pending if entry is not pending]
+        return answer, None
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def clear(self):
+        with self._lock:
+            self._live[:] = False
+            self._entries = [None] * self.maxsize
+            # Misses computed before now neither get cached nor serve new lookups
+            self._pending = []
+            self._generation += 1
+            self.invalidations += 1
+
+    def __len__(self):
+        return int(self._live.sum())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(self._live.sum()),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "mean_hit_similarity": round(self._hit_similarity / self.hits, 4) if self.hits else None,
+                "guard_rejections": self.guard_rejections,
+                "coalesced": self.coalesced,
+                "duplicate_puts": self.duplicate_puts,
+                "stale_puts": self.stale_puts,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.exceptions import InferenceTimeoutError, ServerOverloadedError
+
+# Returned by `next` once an iterator run by `BoundedInferencePool.iterate` is exhausted
+_EXHAUSTED = object()
+
+
+class BoundedInferencePool:
+    """Runs blocking model calls off the event loop with admission control.
+
+    At most `max_workers` calls run at once and at most `max_queue` more wait
+    for a worker. Anything beyond that is rejected with ServerOverloadedError
+    so the queue, and therefore tail latency, stays bounded. A call that does
+    not finish within `timeout` raises InferenceTimeoutError; its slot is only
+    released once the worker thread actually returns.
+
+    Items for a MicroBatcher are submitted with `run_batched`, which counts
+    against the same limit but does not hold a worker thread while the item
+    waits for its batch, so batches can fill up to the batcher's
+    `max_batch_size` as long as `max_workers + max_queue` allows it. Streams
+    go through `iterate`, which holds one slot and one deadline for the whole
+    stream.
+
+    Args:
+        max_workers (int): Number of threads running model calls.
+        max_queue (int): Number of calls allowed to wait for a free thread.
+        timeout (float): Per-request timeout in seconds.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, timeout=10.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.finished = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def run(self, fn, *args):
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(self._release)
+        return await self._wait(future, self.timeout)
+
+    async def run_batched(self, batcher, item):
+        """Submit `item` to a MicroBatcher and await its result, with the admission control and timeout of `run`."""
+        self._acquire()
+        try:
+            future = batcher.submit(item)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return await self._wait(asyncio.wrap_future(future), self.timeout)
+
+    async def iterate(self, iterator):
+        """Async iterator over the items of a blocking `iterator`, each `next` run on a worker thread.
+
+        The whole iteration takes one slot, released once the last call
+        returns, and has to finish within one `timeout`: InferenceTimeoutError
+        is raised by whichever item would arrive after the deadline.
+        """
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        future = None
+        try:
+            while True:
+                future = loop.run_in_executor(self._executor, next, iterator, _EXHAUSTED)
+                item = await self._wait(future, deadline - loop.time())
+                if item is _EXHAUSTED:
+                    return
+                yield item
+        finally:
+            if future is None or future.done():
+                self._release(future)
+            else:
+                future.add_done_callback(self._release)
+
+    async def _wait(self, future, timeout):
+        try:
+            # Shielded: a timed out call keeps running, and a batcher may still resolve its future
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise InferenceTimeoutError() from None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "timeout_s": self.timeout,
+                "in_flight": self._in_flight,
+                "finished": self.finished,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ServerOverloadedError()
+            self._in_flight += 1
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            self.finished += 1
@@ -0,0 +1,120 @@
+import json
+from collections import Counter, defaultdict
+
+from utils.intent_rules import TemplateMatcher
+from utils.intent_templates import OUTPUT_SLOTS
+
+
+def crop_past(past_key_values, length):
+    """Drop cached key/values past `length` tokens (the rejected draft tokens)."""
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(length)
+        return past_key_values
+    return tuple(tuple(tensor[:, :, :length] for tensor in layer) for layer in past_key_values)
+
+
+def repeat_past(past_key_values, batch_size):
+    """Repeat single-row cached key/values for `batch_size` rows (in place for a Cache object)."""
+    if hasattr(past_key_values, "batch_repeat_interleave"):
+        past_key_values.batch_repeat_interleave(batch_size)
+        return past_key_values
+    return tuple(tuple(tensor.repeat(batch_size, 1, 1, 1) for tensor in layer) for layer in past_key_values)
+
+
+class NgramDrafter:
+    """Proposes continuations from n-gram counts over known outputs.
+
+    For every context of up to `n - 1` tokens the most frequent next token is
+    kept. Drafting looks up the longest context that was seen and backs off
+    to shorter ones.
+
+    Args:
+        n (int): Order of the n-grams.
+    """
+
+    def __init__(self, n=4):
+        self.n = n
+        self._counts = defaultdict(Counter)
+        self._table = {}
+
+    @classmethod
+    def from_texts(cls, tokenizer, texts, n=4):
+        drafter = cls(n)
+        for text in texts:
+            drafter.add(tokenizer(text, add_special_tokens=False).input_ids)
+        drafter.finalize()
+        return drafter
+
+    def add(self, token_ids):
+        for end in range(1, len(token_ids)):
+            for order in range(1, self.n):
+                if end - order < 0:
+                    break
+                self._counts[tuple(token_ids[end - order:end])][token_ids[end]] += 1
+
+    def finalize(self):
+        self._table = {context: counts.most_common(1)[0][0] for context, counts in self._counts.items()}
+        self._counts.clear()
+
+    def draft(self, context_ids, k):
+        context = list(context_ids[-(self.n - 1):])
+        draft = []
+        while len(draft) < k:
+            for order in range(min(self.n - 1, len(context)), 0, -1):
+                token_id = self._table.get(tuple(context[-order:]))
+                if token_id is not None:
+                    break
+            else:
+                break
+            draft.append(token_id)
+            context.append(token_id)
+        return draft
+
+
+class SpeculativeDrafter:
+    """Cheap draft tokens for speculative decoding of the intent JSON.
+
+    When the template matcher recognises the query, the draft is the rest of
+    the JSON answer it expects. Otherwise the n-gram table built from
+    mtn_chatbot_dataset.json outputs proposes the next tokens.
+
+    Args:
+        tokenizer: Tokenizer of the model being decoded.
+        outputs (list): Known output strings, e.g. the "output" field of
+            mtn_chatbot_dataset.json.
+        n (int): Order of the n-gram fallback.
+    """
+
+    def __init__(self, tokenizer, outputs, n=4):
+        self.tokenizer = tokenizer
+        self.matcher = TemplateMatcher()
+        # The prompt ends with the newline before the answer, so outputs are drafted as they are
+        self.ngrams = NgramDrafter.from_texts(tokenizer, outputs, n)
+
+    def expected_answer(self, query):
+        """Start of the JSON answer the template match implies, in the key order of OUTPUT_SLOTS.
+
+        It stops before the first slot the match cannot fill with a value the
+        intent grammar accepts, e.g. the amount of "Pay my water bill", so the
+        draft never proposes tokens that constrained decoding has to reject.
+        """
+        match = self.matcher.match(query)
+        if match is None:
+            return None
+        answer = json.dumps({"intent": match["intent"]})[:-1]
+        for slot in OUTPUT_SLOTS[match["intent"]]:
+            value = match.get(slot)
+            # The grammar only takes whole amounts
+            if value is None or (slot == "amount" and not isinstance(value, int)):
+                return answer
+            answer += f", {json.dumps(slot)}: {json.dumps(value)}"
+        return answer + "}"
+
+    def draft(self, expected_answer, text, context_ids, k):
+        """Return up to `k` token ids likely to follow `text`."""
+        if expected_answer is not None:
+            if expected_answer.startswith(text):
+                remainder = expected_answer[len(text):]
+                if remainder:
+                    return self.tokenizer(remainder, add_special_tokens=False).input_ids[:k]
+        return self.ngrams.draft(context_ids, k)
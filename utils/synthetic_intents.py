@@ -0,0 +1,262 @@
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from string import Formatter
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.intent_templates import ACTIONS, AMOUNT_RANGES, INSTRUCTION, OUTPUT_SLOTS, SLOT_VALUES
+
+# Rows sampled and held in memory at once while writing a shard (one Parquet row group)
+BATCH_SIZE = 100000
+
+_ACTION_NAMES = list(ACTIONS)
+
+# Row layouts: "csv" is mtn_chatbot_dataset.csv, "instruction" is mtn_chatbot_dataset.json
+SCHEMAS = {
+    "csv": pa.schema([
+        ("User Query", pa.string()),
+        ("Action", pa.string()),
+        ("Amount", pa.int64()),
+        ("Recipient", pa.string()),
+    ]),
+    "instruction": pa.schema([
+        ("instruction", pa.string()),
+        ("input", pa.string()),
+        ("output", pa.string()),
+    ]),
+}
+
+
+def sample_example(rng):
+    """Draw one `(action, query, slots)` from the shared template spec.
+
+    `slots` holds the OUTPUT_SLOTS of the action in order, the amount drawn
+    from AMOUNT_RANGES and the other slots from SLOT_VALUES.
+    """
+    action = rng.choice(_ACTION_NAMES)
+    slots = {}
+    for slot in OUTPUT_SLOTS[action]:
+        if slot == "amount":
+            slots[slot] = rng.randint(*AMOUNT_RANGES[action])
+        else:
+            slots[slot] = rng.choice(SLOT_VALUES[slot])
+    query = rng.choice(ACTIONS[action]).format(**slots)
+    return action, query, slots
+
+
+def csv_row(action, query, slots):
+    # The "Recipient" column holds whichever of recipient, bill or account the action takes
+    other = next((value for slot, value in slots.items() if slot != "amount"), None)
+    return {"User Query": query, "Action": action, "Amount": slots.get("amount"), "Recipient": other}
+
+
+def instruction_row(action, query, slots):
+    return {"instruction": INSTRUCTION, "input": query, "output": json.dumps({"intent": action, **slots})}
+
+
+ROW_FORMATS = {"csv": csv_row, "instruction": instruction_row}
+
+
+def iter_rows(num_rows, seed=None, row_format="csv"):
+    """Yield `num_rows` synthetic rows in `row_format`, reproducible for a given seed."""
+    rng = random.Random(seed)
+    to_row = ROW_FORMATS[row_format]
+    for _ in range(num_rows):
+        yield to_row(*sample_example(rng))
+
+
+def _template_pieces(template):
+    # "Send {amount} ZAR to {recipient}" -> ["Send ", ("amount",), " ZAR to ", ("recipient",)]
+    pieces = []
+    for literal, field, _, _ in Formatter().parse(template):
+        if literal:
+            pieces.append(literal)
+        if field is not None:
+            pieces.append((field,))
+    return pieces
+
+
+def _output_pieces(action):
+    # Same text as json.dumps({"intent": action, **slots}) for the ASCII slot values of the spec
+    pieces = ['{"intent": ' + json.dumps(action)]
+    for slot in OUTPUT_SLOTS[action]:
+        pieces.append(f', "{slot}": ' if slot == "amount" else f', "{slot}": "')
+        pieces.append((slot,))
+        if slot != "amount":
+            pieces.append('"')
+    pieces.append("}")
+    return pieces
+
+
+def _render(pieces, columns, count):
+    """Concatenate literal pieces and slot columns element-wise into `count` strings."""
+    parts = [columns[piece[0]] if isinstance(piece, tuple) else pa.scalar(piece) for piece in pieces]
+    if not any(isinstance(part, pa.Array) for part in parts):
+        return pa.array(["".join(pieces)], pa.string()).take(np.zeros(count, dtype=np.int64))
+    return pc.binary_join_element_wise(*parts, "")
+
+
+# Every (action, template) pair with its probability: uniform action, then uniform template
+_GROUPS = [(action, template) for action in _ACTION_NAMES for template in ACTIONS[action]]
+_GROUP_PROBABILITIES = [1 / len(_ACTION_NAMES) / len(ACTIONS[action]) for action, _ in _GROUPS]
+_TEMPLATE_PIECES = [_template_pieces(template) for _, template in _GROUPS]
+_OUTPUT_PIECES = {action: _output_pieces(action) for action in _ACTION_NAMES}
+
+
+def _sample_group(rng, action, pieces, count):
+    columns = {}
+    amount = pa.nulls(count, pa.int64())
+    other = pa.nulls(count, pa.string())
+    for slot in OUTPUT_SLOTS[action]:
+        if slot == "amount":
+            low, high = AMOUNT_RANGES[action]
+            amount = pa.array(rng.integers(low, high + 1, count))
+            columns[slot] = pc.cast(amount, pa.string())
+        else:
+            values = SLOT_VALUES[slot]
+            other = pa.array(values).take(rng.integers(0, len(values), count))
+            columns[slot] = other
+    return _render(pieces, columns, count), amount, other, _render(_OUTPUT_PIECES[action], columns, count)
+
+
+def sample_table(rng, num_rows, row_format="csv"):
+    """Sample `num_rows` rows as an Arrow table with the SCHEMAS[row_format] columns.
+
+    Vectorized counterpart of `iter_rows`, with the same distribution: the
+    number of rows per (action, template) pair is drawn at once, each group's
+    amounts and slot values are drawn as NumPy arrays and formatted with
+    Arrow string kernels, and the rows are shuffled at the end.
+
+    Args:
+        rng (numpy.random.Generator): Source of randomness.
+        num_rows (int): Rows to sample.
+        row_format (str): "csv" or "instruction", see ROW_FORMATS.
+    """
+    counts = rng.multinomial(num_rows, _GROUP_PROBABILITIES)
+    queries, amounts, others, outputs = [], [], [], []
+    for (action, _), pieces, count in zip(_GROUPS, _TEMPLATE_PIECES, counts):
+        query, amount, other, output = _sample_group(rng, action, pieces, int(count))
+        queries.append(query)
+        amounts.append(amount)
+        others.append(other)
+        outputs.append(output)
+    order = pa.array(rng.permutation(num_rows))
+    query = pa.concat_arrays(queries).take(order)
+    if row_format == "instruction":
+        instruction = pa.array([INSTRUCTION], pa.string()).take(np.zeros(num_rows, dtype=np.int64))
+        columns = [instruction, query, pa.concat_arrays(outputs).take(order)]
+    else:
+        action_ids = np.repeat(np.arange(len(_GROUPS)), counts)
+        group_actions = pa.array([action for action, _ in _GROUPS], pa.string())
+        columns = [
+            query,
+            group_actions.take(pa.array(action_ids)).take(order),
+            pa.concat_arrays(amounts).take(order),
+            pa.concat_arrays(others).take(order),
+        ]
+    return pa.Table.from_arrays(columns, schema=SCHEMAS[row_format])
+
+
+def iter_tables(num_rows, rng, row_format="csv", batch_size=BATCH_SIZE):
+    """Yield tables of at most `batch_size` sampled rows, `num_rows` in total."""
+    for start in range(0, num_rows, batch_size):
+        yield sample_table(rng, min(batch_size, num_rows - start), row_format)
+
+
+def shard_seed(seed, shard_index):
+    # An independent stream per shard, the same whatever the number of workers
+    return int(np.random.SeedSequence(seed, spawn_key=(shard_index,)).generate_state(1)[0])
+
+
+def _json_value(column):
+    if pa.types.is_string(column.type):
+        # JSON string escapes; the control characters other than newline and tab do not occur in the spec
+        for char, escaped in (("\\", "\\\\"), ('"', '\\"'), ("\n", "\\n"), ("\t", "\\t")):
+            if pc.any(pc.match_substring(column, char)).as_py():
+                column = pc.replace_substring(column, char, escaped)
+        column = pc.binary_join_element_wise('"', column, '"', "")
+    else:
+        column = pc.cast(column, pa.string())
+    return pc.fill_null(column, "null")
+
+
+def json_lines(table):
+    """Serialize a table to JSON lines, `json.dumps(row, ensure_ascii=False)` per line, with Arrow string kernels.
+
+    Returns:
+        bytes: The UTF-8 encoded lines.
+    """
+    if table.num_rows == 0:
+        return b""
+    parts = []
+    for index, name in enumerate(table.column_names):
+        parts.append(("{" if index == 0 else ", ") + json.dumps(name) + ": ")
+        parts.append(_json_value(table.column(name).combine_chunks()))
+    parts.append("}\n")
+    lines = pc.binary_join_element_wise(*parts, "")
+    # A fresh array without nulls: its data buffer is the lines laid end to end
+    _, offsets, data = lines.buffers()
+    start, end = np.frombuffer(offsets, dtype=np.int32)[[lines.offset, lines.offset + len(lines)]]
+    return data[start:end].to_pybytes()
+
+
+def write_shard(path, tables, row_format):
+    """Stream tables to a `.jsonl` or `.parquet` file and return how many rows were written."""
+    count = 0
+    if path.endswith(".parquet"):
+        with pq.ParquetWriter(path, SCHEMAS[row_format]) as writer:
+            for table in tables:
+                writer.write_table(table)
+                count += table.num_rows
+        return count
+    with open(path, "wb") as f:
+        for table in tables:
+            f.write(json_lines(table))
+            count += table.num_rows
+    return count
+
+
+def _generate_shard(task):
+    shard_index, num_rows, seed, row_format, path = task
+    rng = np.random.default_rng(shard_seed(seed, shard_index))
+    return path, write_shard(path, iter_tables(num_rows, rng, row_format), row_format)
+
+
+def shard_paths(num_shards, output_dir, row_format, file_format):
+    return [
+        os.path.join(output_dir, f"{row_format}-{shard:05d}-of-{num_shards:05d}.{file_format}")
+        for shard in range(num_shards)
+    ]
+
+
+def generate_shards(total_rows, num_shards, output_dir, row_format="csv", file_format="jsonl", seed=0, workers=None):
+    """Write `total_rows` synthetic rows as `num_shards` files generated in parallel.
+
+    Each shard is produced by one process from its own seed (derived from
+    `seed` and the shard index) with `sample_table`, and streamed to disk one
+    batch at a time, so the output only depends on `seed` and `num_shards`.
+
+    Args:
+        total_rows (int): Rows over all shards.
+        num_shards (int): Number of output files.
+        output_dir (str): Directory of the shards, created if missing.
+        row_format (str): "csv" or "instruction", see ROW_FORMATS.
+        file_format (str): "jsonl" or "parquet".
+        seed (int): Base seed of the run.
+        workers (int): Processes, one per CPU by default.
+
+    Returns:
+        list: `(path, rows)` for every shard.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [
+        (shard, total_rows // num_shards + (shard < total_rows % num_shards), seed, row_format, path)
+        for shard, path in enumerate(shard_paths(num_shards, output_dir, row_format, file_format))
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_generate_shard, tasks))
@@ -0,0 +1,136 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+
+from datasets import Dataset, load_dataset, load_from_disk
+
+# Tokenized datasets are stored under <TOKENIZED_CACHE_DIR>/<key>/ as Arrow shards
+TOKENIZED_CACHE_DIR = os.getenv("TOKENIZED_CACHE_DIR", "./tokenized_cache")
+MAX_SHARD_SIZE = "100MB"
+_FORMATS = {".csv": "csv", ".json": "json", ".jsonl": "json", ".parquet": "parquet"}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of everything about the tokenizer that changes the ids it produces."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "class": type(tokenizer).__name__,
+        "name_or_path": tokenizer.name_or_path,
+        "vocab_size": len(tokenizer),
+        "special_tokens": tokenizer.special_tokens_map,
+    }, sort_keys=True, default=str).encode())
+    # Fast tokenizers serialize their whole pipeline (normalizer, model, post-processor).
+    # Truncation and padding are call-time settings that the last call leaves behind.
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        pipeline = json.loads(backend.to_str())
+        pipeline.pop("truncation", None)
+        pipeline.pop("padding", None)
+        digest.update(json.dumps(pipeline, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def function_fingerprint(function, _seen=None):
+    """Hash of the code a mapping function runs.
+
+    Covers the qualified name, source and defaults of `function` and,
+    recursively, of the Python functions it calls through module globals
+    (e.g. `tokenize_completion_only`), as well as the numbers, strings and
+    booleans it reads from them, such as a COMPLETION_ONLY flag.
+    """
+    seen = set() if _seen is None else _seen
+    if function in seen:
+        return ""
+    seen.add(function)
+    digest = hashlib.sha256()
+    digest.update(f"{function.__module__}.{function.__qualname__}".encode())
+    try:
+        digest.update(inspect.getsource(function).encode())
+    except (OSError, TypeError):
+        digest.update(function.__code__.co_code)
+    digest.update(repr(function.__defaults__).encode())
+    for name in function.__code__.co_names:
+        value = function.__globals__.get(name)
+        if inspect.isfunction(value):
+            digest.update(function_fingerprint(value, seen).encode())
+        elif isinstance(value, (bool, int, float, str)):
+            digest.update(f"{name}={value!r}".encode())
+    return digest.hexdigest()
+
+
+def cache_key(data_file, tokenizer, max_length, tokenize_function, extra=None):
+    """Content address of a tokenized dataset.
+
+    Covers the bytes of the data file, the tokenizer, the max length, the
+    code of the tokenize function and of the functions it calls (see
+    `function_fingerprint`) and any `extra` JSON-serializable state it
+    depends on, such as a label mapping.
+    """
+    digest = hashlib.sha256()
+    for part in (
+        file_hash(data_file),
+        tokenizer_fingerprint(tokenizer),
+        str(max_length),
+        function_fingerprint(tokenize_function),
+        json.dumps(extra, sort_keys=True, default=str),
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def load_tokenized(data_file, tokenize_function, tokenizer, max_length, extra=None, cache_dir=TOKENIZED_CACHE_DIR):
+    """Return the tokenized dataset of `data_file`, memory-mapped from the on-disk cache.
+
+    On a miss the file is loaded, mapped through `tokenize_function` (batched,
+    original columns removed) and saved as Arrow shards under the cache key,
+    so the next run with the same data, tokenizer, max length and code only
+    memory-maps the shards.
+
+    Args:
+        data_file (str): CSV, JSON/JSONL, Parquet or Arrow stream file.
+        tokenize_function (callable): Batched `datasets.map` function.
+        tokenizer: Tokenizer used by `tokenize_function`.
+        max_length (int): Truncation length used by `tokenize_function`.
+        extra: Other state `tokenize_function` depends on, part of the key.
+        cache_dir (str): Root directory of the cache.
+
+    Returns:
+        datasets.Dataset: The tokenized dataset.
+    """
+    start = time.perf_counter()
+    key = cache_key(data_file, tokenizer, max_length, tokenize_function, extra)
+    path = os.path.join(cache_dir, key)
+    if os.path.isdir(path):
+        dataset = load_from_disk(path)
+        print(f"Loaded tokenized {data_file} from {path} in {time.perf_counter() - start:.2f}s")
+        return dataset
+
+    extension = os.path.splitext(data_file)[1].lower()
+    if extension == ".arrow":
+        # Arrow IPC stream written by utils/columnar.py, memory-mapped as is
+        dataset = Dataset.from_file(data_file)
+    else:
+        dataset = load_dataset(_FORMATS[extension], data_files=data_file)["train"]
+    tokenized = dataset.map(tokenize_function, batched=True, remove_columns=dataset.column_names)
+    # Written under a temporary name first, so an interrupted run never leaves a partial entry
+    partial = f"{path}.partial-{os.getpid()}"
+    tokenized.save_to_disk(partial, max_shard_size=MAX_SHARD_SIZE)
+    try:
+        os.rename(partial, path)
+    except OSError:
+        # Another run cached the same key first
+        shutil.rmtree(partial, ignore_errors=True)
+    print(f"Tokenized {data_file} into {path} in {time.perf_counter() - start:.2f}s")
+    return load_from_disk(path)